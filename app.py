@@ -1,5 +1,8 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, g, Response, stream_with_context
 import os
+import io
+import csv
+import json
 import uuid
 from datetime import datetime
 from functools import wraps
@@ -11,6 +14,7 @@ from utils.reminder import ReminderManager
 from utils.pharmacy_locator import PharmacyLocator
 from utils.otc_manager import OTCManager
 from utils.utils import setup_logger, ensure_directory
+from utils.config import Config
 from utils.extractor import PrescriptionExtractor
 from utils.vector_store import VectorStoreManager
 from utils.memory import MemoryManager
@@ -30,6 +34,10 @@ logger = setup_logger(__name__)
 
 UPLOAD_FOLDER = os.path.join(os.getcwd(), 'data', 'input')
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg'}
+CHAT_PAGE_SIZE = 20
+SIDEBAR_PAGE_SIZE = 20
+MAX_STATS_DAYS = 3650
+EXPORT_FIELDS = ['date', 'scheduled_time', 'time_slot', 'medicine_name', 'status', 'actual_time', 'reason', 'timestamp']
 ensure_directory(UPLOAD_FOLDER)
 
 # --- Initialize Core Services ---
@@ -41,7 +49,8 @@ extractor = PrescriptionExtractor()
 vector_store = VectorStoreManager()
 memory_manager = MemoryManager()
 mail_service = MailService()
-scheduler_service = SchedulerService() # Starts background scheduler
+# Starts background scheduler; jobs only run in the process holding the scheduler lease
+scheduler_service = SchedulerService() if Config.RUN_SCHEDULER_IN_WEB else None
 
 rag_graph = None
 try:
@@ -62,6 +71,20 @@ def login_required(f):
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def stats_window(value, default=7):
+    """Clamp a requested adherence window (in days) to a sane range."""
+    try:
+        days = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(days, MAX_STATS_DAYS))
+
+def request_cache():
+    """Per-request memo of Mongo documents, discarded when the request ends."""
+    if 'mongo_cache' not in g:
+        g.mongo_cache = {}
+    return g.mongo_cache
+
 # --- Error Handling ---
 @app.errorhandler(500)
 def internal_error(error):
@@ -179,7 +202,8 @@ def dashboard():
                         if data.get('medicines'):
                             title = f"Rx: {data['medicines'][0].get('name')}..."
                             
-                        memory_manager.get_or_create_session(user, file_id, title=title, filename=filename, details=meds_str + consult_str)
+                        memory_manager.get_or_create_session(user, file_id, title=title, filename=filename, details=meds_str + consult_str,
+                                                             medicines=data.get('medicines'))
                         flash("Prescription analyzed successfully!", "success")
                         return redirect(url_for('dashboard', view=file_id))
                     else:
@@ -188,17 +212,26 @@ def dashboard():
                     logger.error(f"Processing Error: {e}")
                     flash(f"Error processing prescription: {e}", "danger")
 
-    prescriptions = memory_manager.get_user_prescriptions(user)
-    
     active_id = request.args.get('view')
+    view = memory_manager.get_dashboard_view(user, active_id,
+                                             message_limit=CHAT_PAGE_SIZE,
+                                             prescription_limit=SIDEBAR_PAGE_SIZE,
+                                             cache=request_cache())
+    prescriptions = view['prescriptions']
     active_p = None
     chat_history = []
+    history_cursor = None
     
     if active_id:
         active_p = next((p for p in prescriptions if p['id'] == active_id), None)
-        if active_p:
-            sess_id = memory_manager.get_or_create_session(user, active_id)
-            details_text = memory_manager.get_session_details(sess_id)
+        if not active_p and view['active_session']:
+            # Active prescription lives beyond the first sidebar page
+            active_p = {
+                'id': active_id,
+                'title': view['active_session'].get('title') or f"Prescription {active_id[:8]}..."
+            }
+        if active_p and view['active_session']:
+            details_text = view['active_session'].get('details', '')
             active_p['details'] = details_text
             
             # Parse details for card view
@@ -236,13 +269,30 @@ def dashboard():
                             logger.error(f"Error parsing med line: {line} - {e}")
             
             active_p['med_list'] = med_list
-            chat_history = memory_manager.get_history(sess_id)
+            chat_history = view['messages']
+            history_cursor = view['next_cursor']
 
     return render_template('dashboard.html', 
                            user=user, 
                            prescriptions=prescriptions, 
                            active_p=active_p, 
-                           chat_history=chat_history)
+                           chat_history=chat_history,
+                           history_cursor=history_cursor,
+                           prescriptions_cursor=view['prescriptions_cursor'])
+
+@app.route('/api/prescriptions', methods=['GET'])
+@login_required
+def list_prescriptions():
+    after = request.args.get('after')
+    limit = max(1, min(request.args.get('limit', SIDEBAR_PAGE_SIZE, type=int), 100))
+    with_count = request.args.get('count') == '1'
+    
+    try:
+        page = memory_manager.get_user_prescriptions(session['user'], limit=limit, after=after, with_count=with_count)
+        return jsonify(page)
+    except Exception as e:
+        logger.error(f"List Prescriptions Error: {e}")
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/api/prescription/delete', methods=['POST'])
 @login_required
@@ -265,6 +315,51 @@ def delete_prescription():
         logger.error(f"Delete Prescription Error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/prescription/reminders', methods=['POST'])
+@login_required
+def prescription_reminders():
+    data = request.json or {}
+    p_id = data.get('prescription_id')
+    
+    if not p_id:
+        return jsonify({'error': 'prescription_id required'}), 400
+        
+    try:
+        rx_session = memory_manager.get_session(session['user'], p_id, cache=request_cache())
+        if not rx_session:
+            return jsonify({'error': 'Prescription not found'}), 404
+        medicines = rx_session.get('medicines')
+        if not medicines:
+            return jsonify({'error': 'No structured medicines stored for this prescription. Please re-upload it.'}), 422
+        
+        common = {
+            'start_date': data.get('start_date') or datetime.now().strftime("%Y-%m-%d"),
+            'email_notification': bool(data.get('email_notification')),
+            'notification_email': data.get('notification_email') or None,
+            'timezone': data.get('timezone') or Config.DEFAULT_TIMEZONE
+        }
+        try:
+            datetime.strptime(common['start_date'], "%Y-%m-%d")
+        except ValueError:
+            return jsonify({'error': 'Invalid start date. Use YYYY-MM-DD.'}), 400
+        
+        plan = reminder_manager.plan_from_prescription(medicines)
+        invalid = Validator.validate_medication_batch(plan['items'], common)
+        if invalid:
+            return jsonify({
+                'error': 'Validation failed',
+                'details': {plan['items'][i]['name']: errs for i, errs in invalid.items()}
+            }), 400
+        
+        res = reminder_manager.add_reminders_bulk(session['user'], plan['items'], prescription_id=p_id, **common)
+        if not res['success']:
+            return jsonify({'error': res.get('error')}), 500
+        return jsonify({'success': True, 'created': res['created'], 'duplicates': res['duplicates'],
+                        'skipped': plan['skipped']})
+    except Exception as e:
+        logger.error(f"Prescription Reminders Error: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/chat', methods=['POST'])
 @login_required
 def chat_api():
@@ -293,6 +388,37 @@ def chat_api():
         logger.error(f"Chat API Error: {e}")
         return jsonify({'answer': f"Error: {str(e)}"}), 500
 
+@app.route('/api/chat/history', methods=['GET'])
+@login_required
+def chat_history_api():
+    pid = request.args.get('prescription_id')
+    before = request.args.get('before')
+    limit = max(1, min(request.args.get('limit', CHAT_PAGE_SIZE, type=int), 100))
+    
+    if not pid:
+        return jsonify({'error': 'prescription_id required'}), 400
+        
+    try:
+        chat_session = memory_manager.get_session(session['user'], pid, cache=request_cache())
+        if not chat_session:
+            return jsonify({'messages': [], 'next_cursor': None})
+        page = memory_manager.get_history_page(chat_session['session_id'], limit=limit, before=before,
+                                               check_archive=bool(chat_session.get('has_archive')))
+        return jsonify({
+            'messages': [
+                {
+                    'role': m.get('role'),
+                    'content': m.get('content'),
+                    'timestamp': m['timestamp'].isoformat() if m.get('timestamp') else None
+                }
+                for m in page['messages']
+            ],
+            'next_cursor': page['next_cursor']
+        })
+    except Exception as e:
+        logger.error(f"Chat History Error: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/medications', methods=['GET', 'POST'])
 @login_required
 def medications():
@@ -308,7 +434,8 @@ def medications():
             'email_notification': 'email_notification' in request.form,
             'notification_email': request.form.get('notification_email'),
             'calendar_sync': 'calendar' in request.form,
-            'instructions': request.form.get('instructions')
+            'instructions': request.form.get('instructions'),
+            'timezone': request.form.get('timezone') or Config.DEFAULT_TIMEZONE
         }
         
         # Validation
@@ -329,7 +456,8 @@ def medications():
 
                     email_notification=form_data['email_notification'],
                     notification_email=form_data['notification_email'],
-                    instructions=form_data['instructions']
+                    instructions=form_data['instructions'],
+                    timezone=form_data['timezone']
                 )
                 
                 if res['success']:
@@ -348,7 +476,8 @@ def medications():
                                 form_data['dosage'],
                                 form_data['times'],
                                 form_data['start_date'],
-                                form_data['duration']
+                                form_data['duration'],
+                                timezone=form_data['timezone']
                             )
                             if cal_res['success']:
                                 flash(f"Synced {cal_res['created']} events to Google Calendar.", "info")
@@ -362,7 +491,7 @@ def medications():
             
     reminders = reminder_manager.get_user_reminders(session['user'])
     todays_doses = reminder_manager.get_todays_reminders(session['user'])
-    stats = reminder_manager.get_adherence_stats(session['user'])
+    stats = reminder_manager.get_adherence_stats(session['user'], days=stats_window(request.args.get('days')))
     
     return render_template('medications.html', 
                            user=session['user'], 
@@ -383,10 +512,15 @@ def update_medication_status():
         return jsonify({'error': 'Missing required fields'}), 400
         
     try:
+        # The slot feeds per-slot stats, so it comes from the reminder, not the client
+        time_slot = reminder_manager.resolve_time_slot(session['user'], med_name, time)
+        if data.get('time_slot') and data['time_slot'] != time_slot:
+            return jsonify({'error': f"time_slot does not match the {time} dose ({time_slot})"}), 400
         if action == 'taken':
-            res = reminder_manager.mark_as_taken(session['user'], med_name, time)
+            res = reminder_manager.mark_as_taken(session['user'], med_name, time, time_slot=time_slot)
         elif action == 'skipped':
-            res = reminder_manager.mark_as_skipped(session['user'], med_name, time, reason=data.get('reason'))
+            res = reminder_manager.mark_as_skipped(session['user'], med_name, time, reason=data.get('reason'),
+                                                   time_slot=time_slot)
         else:
             return jsonify({'error': 'Invalid action'}), 400
             
@@ -405,7 +539,7 @@ def email_report():
         return jsonify({'error': 'Email required'}), 400
         
     try:
-        stats = reminder_manager.get_adherence_stats(session['user'])
+        stats = reminder_manager.get_adherence_stats(session['user'], days=stats_window(data.get('days')))
         success, msg = mail_service.send_performance_report(email, stats)
         
         if success:
@@ -416,6 +550,52 @@ def email_report():
         logger.error(f"Email Report Error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/adherence/export', methods=['GET'])
+@login_required
+def export_adherence():
+    fmt = request.args.get('format', 'ndjson').lower()
+    start = request.args.get('start')
+    end = request.args.get('end')
+    medicine = request.args.get('medicine') or None
+    
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+    for value in (start, end):
+        if value:
+            try:
+                datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    
+    logs = reminder_manager.iter_adherence_logs(session['user'], start, end, medicine)
+    
+    def generate_ndjson():
+        for log in logs:
+            yield json.dumps({field: log.get(field) for field in EXPORT_FIELDS}, default=str) + "\n"
+    
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for log in logs:
+            writer.writerow(log)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+        yield buffer.getvalue()
+    
+    # No Content-Length on a generator response, so it goes out chunked
+    if fmt == 'csv':
+        body, mimetype = generate_csv(), 'text/csv'
+    else:
+        body, mimetype = generate_ndjson(), 'application/x-ndjson'
+    filename = f"adherence_{datetime.now().strftime('%Y%m%d')}.{fmt}"
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
 @app.route('/pharmacy')
 @login_required
 def pharmacy():
@@ -455,6 +635,11 @@ def pharmacy_search():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/pharmacy/stats', methods=['GET'])
+@login_required
+def pharmacy_stats():
+    return jsonify(pharmacy_locator.geocode_stats())
+
 @app.route('/safety')
 @login_required
 def safety():
@@ -0,0 +1,19 @@
+"""
+Populate the per-user, per-medicine, per-day adherence rollups from the
+existing adherence_log (and archived months). Safe to re-run.
+
+ReminderManager runs this automatically on start-up while the rollups are
+empty; run it by hand to rebuild them, e.g. after restoring adherence_log.
+
+Usage (from the project root):
+    python -m scripts.backfill_adherence_rollups
+"""
+from utils.reminder import ReminderManager
+
+
+def main():
+    ReminderManager().backfill_daily_rollups()
+
+
+if __name__ == "__main__":
+    main()
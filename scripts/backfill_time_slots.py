@@ -0,0 +1,16 @@
+"""
+One-off migration: add slot maps to reminders created before they existed
+and record time_slot on legacy adherence logs. Safe to re-run.
+
+Usage (from the project root):
+    python -m scripts.backfill_time_slots
+"""
+from utils.reminder import ReminderManager
+
+
+def main():
+    ReminderManager().backfill_time_slots()
+
+
+if __name__ == "__main__":
+    main()
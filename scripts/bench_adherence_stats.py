@@ -0,0 +1,113 @@
+"""
+Benchmark ReminderManager.get_adherence_stats on synthetic users with years
+of adherence logs. Data is written to a scratch database (default
+"medimate_bench") on MONGO_URI and dropped afterwards unless --keep is set.
+
+Rollup-backed stats are compared against the original approach of loading
+every log in the window and filtering it once per reminder.
+
+Usage (from the project root):
+    python -m scripts.bench_adherence_stats [--users 5] [--years 3] [--meds 6]
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from scripts.bench_common import bench_db
+from utils.reminder import ReminderManager
+from utils.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+SLOTS = ["08:00", "14:00", "21:00"]
+
+
+def seed(manager, users, years, meds):
+    today = datetime.now().date()
+    for u in range(users):
+        user_id = f"bench_user_{u}"
+        manager.reminders.insert_many([
+            {
+                "user_id": user_id,
+                "medicine_name": f"Medicine {m}",
+                "dosage": "1 tab",
+                "frequency": "Daily",
+                "times": SLOTS,
+                "is_active": True,
+                "created_at": datetime.now().isoformat()
+            }
+            for m in range(meds)
+        ])
+        batch = []
+        for day in range(years * 365):
+            date = (today - timedelta(days=day)).isoformat()
+            for m in range(meds):
+                for slot in SLOTS:
+                    batch.append({
+                        "user_id": user_id,
+                        "medicine_name": f"Medicine {m}",
+                        "scheduled_time": slot,
+                        "date": date,
+                        "timestamp": f"{date}T{slot}:00",
+                        "status": "taken" if random.random() < 0.85 else "skipped"
+                    })
+            if len(batch) >= 10000:
+                manager.adherence.insert_many(batch, ordered=False)
+                batch = []
+        if batch:
+            manager.adherence.insert_many(batch, ordered=False)
+    logger.info(f"Seeded {manager.adherence.estimated_document_count()} adherence logs")
+    manager.backfill_daily_rollups()
+
+
+def python_stats(manager, user_id, days):
+    """The pre-aggregation implementation, kept here as the baseline."""
+    reminders = list(manager.reminders.find({"user_id": user_id, "is_active": True}))
+    start_date = (datetime.now() - timedelta(days=days)).date().isoformat()
+    logs = list(manager.adherence.find({"user_id": user_id, "date": {"$gte": start_date}}))
+    taken = len([log for log in logs if log['status'] == 'taken'])
+    for reminder in reminders:
+        med_logs = [log for log in logs if log.get('medicine_name') == reminder['medicine_name']]
+        len([log for log in med_logs if log['status'] == 'taken'])
+    return taken
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Adherence stats benchmark")
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--meds", type=int, default=6)
+    parser.add_argument("--windows", default="7,30,90,365")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--db", type=bench_db, default="medimate_bench")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch database")
+    args = parser.parse_args()
+
+    manager = ReminderManager(db_name=args.db)
+
+    try:
+        if manager.adherence.estimated_document_count() == 0:
+            seed(manager, args.users, args.years, args.meds)
+        user_id = "bench_user_0"
+        print(f"{'window':>8} {'rollup ms':>12} {'python ms':>10}")
+        for days in [int(d) for d in args.windows.split(",")]:
+            pipeline_ms = timed(lambda: manager.get_adherence_stats(user_id, days=days), args.repeat)
+            python_ms = timed(lambda: python_stats(manager, user_id, days), args.repeat)
+            print(f"{days:>7}d {pipeline_ms:>12.1f} {python_ms:>10.1f}")
+    finally:
+        if not args.keep:
+            manager.client.drop_database(args.db)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+"""
+Helpers shared by the scripts/bench_*.py benchmarks.
+"""
+import argparse
+
+
+def bench_db(name: str) -> str:
+    """
+    argparse type for --db. Benchmarks seed and then drop this database, so
+    only names that are clearly scratch databases are accepted.
+    """
+    if "bench" not in name.lower():
+        raise argparse.ArgumentTypeError(
+            f"refusing to use '{name}': benchmark databases are dropped afterwards, "
+            f"so the name must contain 'bench'"
+        )
+    return name
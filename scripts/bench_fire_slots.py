@@ -0,0 +1,104 @@
+"""
+Measure how long a scheduler tick takes with N active reminders, comparing
+the fire-slot point lookup against the original multikey `times` scan.
+Data is written to a scratch database (default "medimate_bench") on
+MONGO_URI and dropped afterwards unless --keep is set.
+
+Usage (from the project root):
+    python -m scripts.bench_fire_slots [--reminders 100000]
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from services.reminder_engine import ReminderEngine
+from scripts.bench_common import bench_db
+from utils.reminder import ReminderManager
+from utils.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+
+def seed(manager, count):
+    today = datetime.now().date()
+    batch = []
+    for i in range(count):
+        times = sorted({f"{random.randint(6, 22):02d}:{random.choice([0, 15, 30, 45]):02d}" for _ in range(3)})
+        batch.append({
+            "user_id": f"bench_user_{i % 5000}",
+            "medicine_name": f"Medicine {i}",
+            "dosage": "1 tab",
+            "frequency": "Daily",
+            "times": times,
+            "start_date": (today - timedelta(days=random.randint(0, 10))).isoformat(),
+            "end_date": (today + timedelta(days=random.randint(1, 30))).isoformat(),
+            "email_notification": True,
+            "notification_email": f"user{i}@example.com",
+            "is_active": True
+        })
+        if len(batch) >= 10000:
+            manager.reminders.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        manager.reminders.insert_many(batch, ordered=False)
+    manager.reminders.create_index("times")
+    manager.rebuild_fire_slots()
+
+
+def legacy_due(manager, now):
+    today = now.date().isoformat()
+    return list(manager.reminders.find({
+        "is_active": True,
+        "email_notification": True,
+        "start_date": {"$lte": today},
+        "end_date": {"$gte": today},
+        "times": now.strftime("%H:%M")
+    }))
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scheduler tick benchmark")
+    parser.add_argument("--reminders", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--db", type=bench_db, default="medimate_bench")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch database")
+    args = parser.parse_args()
+
+    manager = ReminderManager(db_name=args.db)
+
+    try:
+        if manager.reminders.estimated_document_count() == 0:
+            seed(manager, args.reminders)
+        now = datetime.utcnow().replace(hour=8, minute=0, second=0, microsecond=0)
+
+        slot_med, slot_max = timed(lambda: manager.get_due_slots([now]), args.repeat)
+        legacy_med, legacy_max = timed(lambda: legacy_due(manager, now), args.repeat)
+
+        engine = ReminderEngine(manager, lambda slots: None)
+        engine.last_tick = now - timedelta(minutes=1)
+        start = time.perf_counter()
+        sent = engine.tick(now)
+        tick_ms = (time.perf_counter() - start) * 1000
+
+        print(f"active reminders:        {manager.reminders.estimated_document_count()}")
+        print(f"fire slots:              {manager.fire_slots.estimated_document_count()}")
+        print(f"slot lookup   p50/max:   {slot_med:.1f} / {slot_max:.1f} ms")
+        print(f"legacy scan   p50/max:   {legacy_med:.1f} / {legacy_max:.1f} ms")
+        print(f"full tick ({sent} due):   {tick_ms:.1f} ms")
+    finally:
+        if not args.keep:
+            manager.client.drop_database(args.db)
+
+
+if __name__ == "__main__":
+    main()
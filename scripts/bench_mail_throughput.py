@@ -0,0 +1,152 @@
+"""
+End-to-end mail throughput against a local SMTP sink (scripts/smtp_sink.py),
+so pooling and batching changes can be measured without real traffic.
+
+Seeds N reminders due at the same minute across R recipients, runs one
+scheduler tick (coalescing + outbox enqueue), then drains the outbox with
+the worker pool. Reports messages/sec, p50/p99 enqueue-to-delivery latency
+and SMTP connection counts. With --reports, also times EmailManager
+adherence reports against the same sink.
+
+Reminder and outbox data go to a scratch database (default "medimate_bench")
+on MONGO_URI, dropped afterwards unless --keep is set.
+
+Usage (from the project root):
+    python -m scripts.bench_mail_throughput [--reminders 2000] [--recipients 500] [--workers 3]
+"""
+import argparse
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+from scripts.bench_common import bench_db
+from scripts.smtp_sink import SMTPSink
+from services.mail_service import MailService
+from services.outbox import EmailOutbox, OutboxWorkerPool
+from services.reminder_engine import ReminderEngine
+from services.smtp_pool import SMTPPool
+from utils.config import Config
+from utils.email_service import EmailManager
+from utils.reminder import ReminderManager
+from utils.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+
+def point_mail_at(sink):
+    """Route MailService/EmailManager to the sink; must run before they are constructed"""
+    host, port = sink.address
+    Config.SMTP_HOST, Config.SMTP_PORT, Config.SMTP_SECURITY = host, port, "none"
+    Config.EMAIL_SENDER = Config.EMAIL_SENDER or "bench@example.com"
+    Config.EMAIL_PASSWORD = Config.EMAIL_PASSWORD or "bench"
+    os.environ.setdefault("MAIL_USERNAME", "bench@example.com")
+    os.environ.setdefault("MAIL_PASSWORD", "bench")
+
+
+def seed(manager, count, recipients, fire_at):
+    today = fire_at.date()
+    manager.reminders.insert_many([
+        {
+            "user_id": f"bench_user_{i % recipients}",
+            "medicine_name": f"Medicine {i}",
+            "dosage": "1 tab",
+            "frequency": "Daily",
+            "times": [fire_at.strftime("%H:%M")],
+            "timezone": "UTC",
+            "start_date": (today - timedelta(days=1)).isoformat(),
+            "end_date": (today + timedelta(days=1)).isoformat(),
+            "email_notification": True,
+            "notification_email": f"user{i % recipients}@example.com",
+            "is_active": True
+        }
+        for i in range(count)
+    ], ordered=False)
+    manager.rebuild_fire_slots()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mail throughput benchmark against a local SMTP sink")
+    parser.add_argument("--reminders", type=int, default=2000)
+    parser.add_argument("--recipients", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=Config.OUTBOX_WORKERS)
+    parser.add_argument("--pool-size", type=int, default=Config.SMTP_POOL_SIZE)
+    parser.add_argument("--coalesce-minutes", type=int, default=Config.REMINDER_COALESCE_MINUTES)
+    parser.add_argument("--reports", type=int, default=0, help="Also send N EmailManager adherence reports")
+    parser.add_argument("--timeout", type=int, default=300, help="Give up draining after N seconds")
+    parser.add_argument("--db", type=bench_db, default="medimate_bench")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch database")
+    args = parser.parse_args()
+
+    sink = SMTPSink().start()
+    point_mail_at(sink)
+
+    manager = ReminderManager(db_name=args.db)
+    mail = MailService(outbox=EmailOutbox(db_name=args.db))
+    mail.pool = SMTPPool(mail.smtp_server, mail.smtp_port, mail.sender_email, mail.password,
+                         Config.SMTP_SECURITY, size=args.pool_size)
+
+    try:
+        fire_at = datetime.utcnow().replace(second=0, microsecond=0) + timedelta(minutes=1)
+        seed(manager, args.reminders, args.recipients, fire_at)
+
+        engine = ReminderEngine(manager, mail.send_due_doses, coalesce_minutes=args.coalesce_minutes)
+        engine.last_tick = fire_at - timedelta(minutes=1)
+        start = time.perf_counter()
+        emails = engine.tick(fire_at)
+        tick_ms = (time.perf_counter() - start) * 1000
+
+        workers = OutboxWorkerPool(mail.outbox, mail.handlers, size=args.workers, poll_seconds=0.05)
+        start = time.perf_counter()
+        workers.start()
+        deadline = time.monotonic() + args.timeout
+        while time.monotonic() < deadline:
+            depth = mail.outbox.stats()
+            if depth['pending'] == 0 and depth['processing'] == 0:
+                break
+            time.sleep(0.1)
+        drain_s = time.perf_counter() - start
+        workers.stop()
+
+        latencies = [
+            (job['sent_at'] - job['created_at']).total_seconds() * 1000
+            for job in mail.outbox.jobs.find({"status": "sent"}, {"sent_at": 1, "created_at": 1})
+        ]
+        dead = mail.outbox.jobs.count_documents({"status": "dead"})
+        pool = mail.pool_stats()
+
+        print(f"due doses:               {args.reminders} for {args.recipients} recipients")
+        print(f"scheduler tick:          {tick_ms:.1f} ms, {emails} emails queued")
+        print(f"delivered / dead:        {len(latencies)} / {dead} in {drain_s:.2f} s")
+        if latencies:
+            print(f"throughput:              {len(latencies) / drain_s:.1f} msg/s")
+            print(f"enqueue->delivery p50:   {statistics.median(latencies):.0f} ms")
+            print(f"enqueue->delivery p99:   {percentile(latencies, 99):.0f} ms")
+        print(f"SMTP connections:        {sink.stats['connections']} (pool reuse {pool['reuse_rate']}%)")
+        print(f"SMTP send avg/max:       {pool['avg_latency_ms']} / {pool['max_latency_ms']} ms")
+
+        if args.reports:
+            reports = EmailManager()
+            stats = manager.get_adherence_stats("bench_user_0")
+            stats['reminder_details'] = stats['reminder_details'] or [
+                {"medicine_name": "Medicine 0", "total_doses": 1, "taken": 1, "missed": 0, "adherence": 100.0}
+            ]
+            before = sink.stats['connections']
+            start = time.perf_counter()
+            for i in range(args.reports):
+                reports.send_adherence_report(f"user{i}@example.com", stats)
+            report_s = time.perf_counter() - start
+            print(f"EmailManager reports:    {args.reports / report_s:.1f} msg/s, "
+                  f"{sink.stats['connections'] - before} connections")
+    finally:
+        sink.stop()
+        if not args.keep:
+            manager.client.drop_database(args.db)
+
+
+if __name__ == "__main__":
+    main()
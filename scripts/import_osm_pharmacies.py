@@ -0,0 +1,220 @@
+"""
+Build an offline pharmacy index for PharmacyLocator from a local OSM extract
+(e.g. a Geofabrik region download). Pulls every amenity=pharmacy node, way
+and relation; ways and relations are placed at the centre of their bounding
+box, like Overpass's `out center`.
+
+Reads .osm / .osm.gz / .osm.bz2 XML with the standard library. .osm.pbf
+needs the optional `osmium` package (pip install osmium).
+
+The extract's <bounds> (or PBF header box) marks the area the index is
+trusted for; pass --bounds when the file has none.
+
+Usage (from the project root):
+    python -m scripts.import_osm_pharmacies path/to/region.osm.pbf [--name karnataka]
+        [--bounds south,west,north,east] [--out-dir data/osm_index]
+"""
+import argparse
+import bz2
+import gzip
+import os
+import time
+import xml.etree.ElementTree as ET
+from utils.config import Config
+from utils.pharmacy_index import write_index
+
+
+class PharmacyCollector:
+    """Pharmacy features found so far, plus the node/way ids still needed to place ways and relations."""
+
+    def __init__(self):
+        self.pharmacies = []
+        self.ways = {}        # way id -> (tags, node refs)
+        self.relations = {}   # relation id -> (tags, node refs, way refs)
+        self.member_ways = {}  # way id -> node refs, for ways inside pharmacy relations
+        self.coords = {}      # node id -> (lat, lon)
+
+    def add(self, tags, lat, lon):
+        self.pharmacies.append({
+            "latitude": round(lat, 7),
+            "longitude": round(lon, 7),
+            "name": tags.get("name"),
+            "address": ", ".join(filter(None, [
+                tags.get("addr:housenumber"),
+                tags.get("addr:street"),
+                tags.get("addr:city"),
+                tags.get("addr:postcode")
+            ])) or None,
+            "phone": tags.get("phone") or tags.get("contact:phone"),
+            "opening_hours": tags.get("opening_hours")
+        })
+
+    def needed_nodes(self):
+        needed = set()
+        for _, refs in self.ways.values():
+            needed.update(refs)
+        for refs in self.member_ways.values():
+            needed.update(refs)
+        for _, node_refs, _ in self.relations.values():
+            needed.update(node_refs)
+        return needed
+
+    def _center(self, refs):
+        points = [self.coords[ref] for ref in refs if ref in self.coords]
+        if not points:
+            return None
+        lats = [p[0] for p in points]
+        lons = [p[1] for p in points]
+        return (min(lats) + max(lats)) / 2, (min(lons) + max(lons)) / 2
+
+    def finish(self):
+        for tags, refs in self.ways.values():
+            center = self._center(refs)
+            if center:
+                self.add(tags, *center)
+        for tags, node_refs, way_refs in self.relations.values():
+            refs = list(node_refs)
+            for way_id in way_refs:
+                refs.extend(self.member_ways.get(way_id, ()))
+            center = self._center(refs)
+            if center:
+                self.add(tags, *center)
+        return self.pharmacies
+
+
+def _open_xml(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    return open(path, "rb")
+
+
+def _iter_xml(path):
+    """Yield completed top-level OSM elements, freeing each one as we go"""
+    with _open_xml(path) as fh:
+        context = ET.iterparse(fh, events=("start", "end"))
+        _, root = next(context)
+        for event, elem in context:
+            if event == "end" and elem.tag in ("bounds", "node", "way", "relation"):
+                yield elem
+                root.clear()
+
+
+def read_xml(path, collector):
+    """Three streaming passes: features, then member ways of relations, then node coordinates."""
+    bounds = None
+    for elem in _iter_xml(path):
+        if elem.tag == "bounds":
+            bounds = tuple(float(elem.get(k)) for k in ("minlat", "minlon", "maxlat", "maxlon"))
+            continue
+        tags = {t.get("k"): t.get("v") for t in elem.findall("tag")}
+        if tags.get("amenity") != "pharmacy":
+            continue
+        if elem.tag == "node":
+            collector.add(tags, float(elem.get("lat")), float(elem.get("lon")))
+        elif elem.tag == "way":
+            collector.ways[elem.get("id")] = (tags, [nd.get("ref") for nd in elem.findall("nd")])
+        else:
+            members = elem.findall("member")
+            collector.relations[elem.get("id")] = (
+                tags,
+                [m.get("ref") for m in members if m.get("type") == "node"],
+                [m.get("ref") for m in members if m.get("type") == "way"]
+            )
+
+    wanted_ways = {ref for _, _, way_refs in collector.relations.values() for ref in way_refs}
+    if wanted_ways:
+        for elem in _iter_xml(path):
+            if elem.tag == "way" and elem.get("id") in wanted_ways:
+                collector.member_ways[elem.get("id")] = [nd.get("ref") for nd in elem.findall("nd")]
+
+    needed = collector.needed_nodes()
+    if needed:
+        for elem in _iter_xml(path):
+            if elem.tag == "node" and elem.get("id") in needed:
+                collector.coords[elem.get("id")] = (float(elem.get("lat")), float(elem.get("lon")))
+    return bounds
+
+
+def read_pbf(path, collector):
+    try:
+        import osmium
+    except ImportError:
+        raise SystemExit("Reading .pbf extracts needs the osmium package: pip install osmium")
+
+    class Features(osmium.SimpleHandler):
+        def node(self, n):
+            if n.tags.get("amenity") == "pharmacy":
+                collector.add(dict(n.tags), n.location.lat, n.location.lon)
+
+        def way(self, w):
+            if w.tags.get("amenity") == "pharmacy":
+                refs = [str(nd.ref) for nd in w.nodes]
+                collector.ways[str(w.id)] = (dict(w.tags), refs)
+                for nd in w.nodes:
+                    if nd.location.valid():
+                        collector.coords[str(nd.ref)] = (nd.location.lat, nd.location.lon)
+
+        def relation(self, r):
+            if r.tags.get("amenity") == "pharmacy":
+                collector.relations[str(r.id)] = (
+                    dict(r.tags),
+                    [str(m.ref) for m in r.members if m.type == "n"],
+                    [str(m.ref) for m in r.members if m.type == "w"]
+                )
+
+    Features().apply_file(path, locations=True)
+
+    wanted_ways = {ref for _, _, way_refs in collector.relations.values() for ref in way_refs}
+    wanted_nodes = {ref for _, node_refs, _ in collector.relations.values() for ref in node_refs}
+    if wanted_ways or wanted_nodes:
+        class Members(osmium.SimpleHandler):
+            def node(self, n):
+                if str(n.id) in wanted_nodes:
+                    collector.coords[str(n.id)] = (n.location.lat, n.location.lon)
+
+            def way(self, w):
+                if str(w.id) in wanted_ways:
+                    collector.member_ways[str(w.id)] = [str(nd.ref) for nd in w.nodes]
+                    for nd in w.nodes:
+                        if nd.location.valid():
+                            collector.coords[str(nd.ref)] = (nd.location.lat, nd.location.lon)
+
+        Members().apply_file(path, locations=True)
+
+    box = osmium.io.Reader(path, osmium.osm.osm_entity_bits.NOTHING).header().box()
+    if box.valid():
+        return (box.bottom_left.lat, box.bottom_left.lon, box.top_right.lat, box.top_right.lon)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build an offline pharmacy index from an OSM extract")
+    parser.add_argument("extract", help=".osm, .osm.gz, .osm.bz2 or .osm.pbf file")
+    parser.add_argument("--name", default=None, help="Index name (default: extract file name)")
+    parser.add_argument("--bounds", default=None, help="south,west,north,east covered by the extract")
+    parser.add_argument("--out-dir", default=Config.PHARMACY_INDEX_DIR)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    collector = PharmacyCollector()
+    if args.extract.endswith(".pbf"):
+        bounds = read_pbf(args.extract, collector)
+    else:
+        bounds = read_xml(args.extract, collector)
+    if args.bounds:
+        bounds = tuple(float(v) for v in args.bounds.split(","))
+    pharmacies = collector.finish()
+    if not bounds:
+        raise SystemExit("The extract declares no bounds; pass --bounds south,west,north,east")
+
+    name = args.name or os.path.basename(args.extract).split(".")[0]
+    path = os.path.join(args.out_dir, f"{name}.json.gz")
+    count = write_index(path, pharmacies, bounds, source=os.path.basename(args.extract))
+    print(f"Indexed {count} pharmacies covering {bounds} into {path} "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""
+One-off job: merge duplicate (user_id, prescription_id) chat sessions and
+their messages, then create the unique index that prevents new duplicates.
+
+Usage (from the project root):
+    python -m scripts.merge_duplicate_sessions [--dry-run]
+"""
+import argparse
+from utils.memory import MemoryManager
+from utils.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge duplicate chat sessions")
+    parser.add_argument("--dry-run", action="store_true", help="Report duplicates without modifying data")
+    args = parser.parse_args()
+
+    removed = MemoryManager().merge_duplicate_sessions(dry_run=args.dry_run)
+    action = "Would remove" if args.dry_run else "Removed"
+    logger.info(f"{action} {removed} duplicate session(s)")
+
+
+if __name__ == "__main__":
+    main()
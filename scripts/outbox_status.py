@@ -0,0 +1,26 @@
+"""
+Show email outbox depth and lag, optionally putting dead-lettered jobs back
+in the queue.
+
+Usage (from the project root):
+    python -m scripts.outbox_status [--requeue-dead]
+"""
+import argparse
+from services.outbox import EmailOutbox
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Email outbox depth, lag and dead letters")
+    parser.add_argument("--requeue-dead", action="store_true", help="Retry every dead-lettered job")
+    args = parser.parse_args()
+
+    outbox = EmailOutbox()
+    if args.requeue_dead:
+        print(f"Requeued {outbox.requeue_dead()} dead jobs")
+    stats = outbox.stats()
+    print(f"pending={stats['pending']} processing={stats['processing']} "
+          f"dead={stats['dead']} lag={stats['lag_seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+"""
+Regenerate the reminder_fire_slots due-index from the reminders collection.
+ReminderManager builds them automatically on start-up while the collection
+is empty; run this whenever the slots may have drifted.
+
+Usage (from the project root):
+    python -m scripts.rebuild_fire_slots
+"""
+from utils.reminder import ReminderManager
+
+
+def main():
+    ReminderManager().rebuild_fire_slots()
+
+
+if __name__ == "__main__":
+    main()
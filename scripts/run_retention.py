@@ -0,0 +1,32 @@
+"""
+Move chat messages and adherence logs older than the hot window into the
+monthly archive collections, or export them to gzipped JSONL files.
+
+Usage (from the project root):
+    python -m scripts.run_retention [--mode archive|export] [--hot-days N] [--export-dir PATH]
+
+After upgrading, run once with --mark-sessions to flag sessions whose
+messages were archived before sessions carried `has_archive`.
+"""
+import argparse
+from utils.retention import RetentionManager
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive or export cold history")
+    parser.add_argument("--mode", choices=["archive", "export"], default="archive")
+    parser.add_argument("--hot-days", type=int, default=None, help="Override RETENTION_HOT_DAYS")
+    parser.add_argument("--export-dir", default=None, help="Target directory for --mode export")
+    parser.add_argument("--mark-sessions", action="store_true",
+                        help="Flag every session that has archived messages, then exit")
+    args = parser.parse_args()
+
+    manager = RetentionManager(hot_days=args.hot_days)
+    if args.mark_sessions:
+        print(f"Flagged {manager.mark_archived_sessions()} sessions with archived messages")
+        return
+    manager.run(mode=args.mode, export_dir=args.export_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Minimal local SMTP server that accepts (and discards) every message, for
+load-testing mail delivery without real traffic. Accepts any AUTH PLAIN/LOGIN
+and offers no TLS, so point the app at it with SMTP_SECURITY=none.
+
+Usage (from the project root):
+    python -m scripts.smtp_sink [--port 2525]
+    SMTP_HOST=127.0.0.1 SMTP_PORT=2525 SMTP_SECURITY=none python -m services.scheduler
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+
+class _SinkHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line: str):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        sink = self.server.sink
+        sink.count("connections")
+        self._reply("220 smtp-sink ESMTP ready")
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            verb = raw.decode(errors="replace").strip().split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self._reply("250-smtp-sink")
+                self._reply("250-AUTH PLAIN LOGIN")
+                self._reply("250 8BITMIME")
+            elif verb == "AUTH":
+                args = raw.decode(errors="replace").split()
+                # AUTH LOGIN sends username and password on their own lines
+                if len(args) > 1 and args[1].upper() == "LOGIN":
+                    for _ in range(2 - (len(args) > 2)):
+                        self._reply("334 VXNlcm5hbWU6")
+                        self.rfile.readline()
+                self._reply("235 Authentication successful")
+            elif verb == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                size = 0
+                while True:
+                    line = self.rfile.readline()
+                    if not line or line in (b".\r\n", b".\n"):
+                        break
+                    size += len(line)
+                sink.received(size)
+                self._reply("250 OK: queued")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            elif verb == "STARTTLS":
+                self._reply("454 TLS not available")
+            elif verb in ("HELO", "MAIL", "RCPT", "RSET", "NOOP"):
+                self._reply("250 OK")
+            else:
+                self._reply("502 Command not implemented")
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink:
+    """Threaded sink with connection/message counters; port 0 picks a free port."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self._server = _Server((host, port), _SinkHandler)
+        self._server.sink = self
+        self._lock = threading.Lock()
+        self.stats = {"connections": 0, "messages": 0, "bytes": 0}
+        self.first_at = None
+        self.last_at = None
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    def count(self, key: str, n: int = 1):
+        with self._lock:
+            self.stats[key] += n
+
+    def received(self, size: int):
+        now = time.monotonic()
+        with self._lock:
+            self.stats["messages"] += 1
+            self.stats["bytes"] += size
+            self.first_at = self.first_at or now
+            self.last_at = now
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local SMTP sink")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2525)
+    args = parser.parse_args()
+
+    sink = SMTPSink(args.host, args.port).start()
+    print(f"SMTP sink listening on {args.host}:{args.port}. Press Ctrl+C to exit.")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"connections={sink.stats['connections']} messages={sink.stats['messages']}")
+    except KeyboardInterrupt:
+        sink.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError
+from utils.config import Config
+from utils.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class LeaderLease:
+    """
+    Mongo-backed lease so exactly one process (web worker or standalone
+    scheduler) owns a background loop at a time.
+
+    The holder renews well before `expires_at`; if it dies or loses Mongo,
+    the lease lapses and another process takes over on its next attempt.
+    A TTL index removes leases that nobody renews.
+    """
+
+    def __init__(self, name: str, ttl_seconds: int = Config.SCHEDULER_LEASE_SECONDS):
+        self.client = MongoClient(Config.MONGO_URI, **Config.get_tls_kwargs())
+        self.leases = self.client['medimate']['scheduler_leases']
+        self.name = name
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._held_until = None
+        try:
+            self.leases.create_index("expires_at", name="expires_at_ttl", expireAfterSeconds=0)
+        except Exception as e:
+            logger.warning(f"Could not ensure lease TTL index: {e}")
+
+    @property
+    def is_leader(self) -> bool:
+        # Judged locally so a holder that cannot renew steps down on time
+        return self._held_until is not None and datetime.utcnow() < self._held_until
+
+    def acquire_or_renew(self) -> bool:
+        now = datetime.utcnow()
+        expires_at = now + self.ttl
+        try:
+            self.leases.find_one_and_update(
+                {"_id": self.name, "$or": [{"owner": self.owner}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "expires_at": expires_at, "renewed_at": now}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Held by another live process
+            if self._held_until is not None:
+                logger.warning(f"Lost lease '{self.name}'")
+            self._held_until = None
+            return False
+        except Exception as e:
+            logger.error(f"Lease renewal error for '{self.name}': {e}")
+            return self.is_leader
+        if self._held_until is None:
+            logger.info(f"Acquired lease '{self.name}' as {self.owner}")
+        self._held_until = expires_at
+        return True
+
+    def release(self):
+        try:
+            self.leases.delete_one({"_id": self.name, "owner": self.owner})
+        except Exception as e:
+            logger.warning(f"Could not release lease '{self.name}': {e}")
+        self._held_until = None
@@ -0,0 +1,219 @@
+import os
+import random
+import socket
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+from pymongo import MongoClient, ASCENDING, ReturnDocument
+from utils.config import Config
+from utils.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+PENDING = "pending"
+PROCESSING = "processing"
+SENT = "sent"
+DEAD = "dead"
+
+# Longest wait between retries, however many attempts have failed
+MAX_BACKOFF_SECONDS = 3600
+
+
+class EmailOutbox:
+    """
+    Durable queue of outgoing emails in Mongo.
+
+    Producers `enqueue` a job (a kind plus the payload its handler needs);
+    workers in any process `claim` one atomically. A job is retried with
+    exponential backoff and moved to `dead` after `max_attempts`. A claim
+    whose worker died is taken over once its lease expires, so every job is
+    delivered at least once. Sent jobs expire after a week.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = Config.OUTBOX_MAX_ATTEMPTS,
+        backoff_seconds: int = Config.OUTBOX_BACKOFF_SECONDS,
+        lease_seconds: int = Config.OUTBOX_LEASE_SECONDS,
+        db_name: str = 'medimate'
+    ):
+        self.client = MongoClient(Config.MONGO_URI, **Config.get_tls_kwargs())
+        self.jobs = self.client[db_name]['email_outbox']
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.lease = timedelta(seconds=lease_seconds)
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        try:
+            self.jobs.create_index(
+                [("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_due"
+            )
+            self.jobs.create_index(
+                "sent_at", name="sent_ttl", expireAfterSeconds=7 * 24 * 3600
+            )
+        except Exception as e:
+            logger.warning(f"Could not ensure outbox indexes: {e}")
+
+    def enqueue(self, kind: str, payload: Dict) -> str:
+        now = datetime.utcnow()
+        result = self.jobs.insert_one({
+            "kind": kind,
+            "payload": payload,
+            "status": PENDING,
+            "attempts": 0,
+            "next_attempt_at": now,
+            "created_at": now,
+            "updated_at": now,
+            "last_error": None
+        })
+        return str(result.inserted_id)
+
+    def claim(self, worker_id: str) -> Optional[Dict]:
+        """
+        Atomically take the oldest due job, or one whose worker's lease lapsed.
+        A lapsed job that already used all its attempts (its worker kept
+        dying on it) is dead-lettered instead of being taken again.
+        """
+        now = datetime.utcnow()
+        job = self.jobs.find_one_and_update(
+            {"$or": [
+                {"status": PENDING, "next_attempt_at": {"$lte": now}},
+                {"status": PROCESSING, "next_attempt_at": {"$lte": now}, "attempts": {"$lt": self.max_attempts}}
+            ]},
+            {
+                "$set": {
+                    "status": PROCESSING,
+                    "worker": worker_id,
+                    # Doubles as the claim lease while processing
+                    "next_attempt_at": now + self.lease,
+                    "updated_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("next_attempt_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+        if job is None:
+            self._bury_abandoned(now)
+        return job
+
+    def _bury_abandoned(self, now: datetime):
+        result = self.jobs.update_many(
+            {"status": PROCESSING, "next_attempt_at": {"$lte": now}, "attempts": {"$gte": self.max_attempts}},
+            {"$set": {
+                "status": DEAD,
+                "dead_at": now,
+                "updated_at": now,
+                "last_error": "worker lease expired on the final attempt"
+            }}
+        )
+        if result.modified_count:
+            logger.error(f"Dead-lettered {result.modified_count} outbox jobs whose workers never finished them")
+
+    def complete(self, job: Dict):
+        now = datetime.utcnow()
+        self.jobs.update_one(
+            {"_id": job["_id"], "worker": job.get("worker")},
+            {"$set": {"status": SENT, "sent_at": now, "updated_at": now, "last_error": None}}
+        )
+
+    def fail(self, job: Dict, error: str):
+        now = datetime.utcnow()
+        attempts = job.get("attempts", 1)
+        if attempts >= self.max_attempts:
+            update = {"status": DEAD, "dead_at": now}
+            logger.error(f"Outbox job {job['_id']} ({job['kind']}) dead-lettered after {attempts} attempts: {error}")
+        else:
+            delay = min(self.backoff_seconds * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS)
+            delay *= random.uniform(0.8, 1.2)
+            update = {"status": PENDING, "next_attempt_at": now + timedelta(seconds=delay)}
+            logger.warning(f"Outbox job {job['_id']} ({job['kind']}) failed, retry in {delay:.0f}s: {error}")
+        update.update({"last_error": error, "updated_at": now})
+        self.jobs.update_one({"_id": job["_id"], "worker": job.get("worker")}, {"$set": update})
+
+    def requeue_dead(self) -> int:
+        now = datetime.utcnow()
+        result = self.jobs.update_many(
+            {"status": DEAD},
+            {"$set": {"status": PENDING, "attempts": 0, "next_attempt_at": now, "updated_at": now},
+             "$unset": {"dead_at": ""}}
+        )
+        return result.modified_count
+
+    def stats(self) -> Dict:
+        """Queue depth per status and lag (age in seconds of the oldest due job)"""
+        now = datetime.utcnow()
+        depth = {PENDING: 0, PROCESSING: 0, DEAD: 0}
+        for row in self.jobs.aggregate([
+            {"$match": {"status": {"$in": list(depth)}}},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+        ]):
+            depth[row["_id"]] = row["count"]
+        oldest = self.jobs.find_one(
+            {"status": PENDING, "next_attempt_at": {"$lte": now}},
+            {"created_at": 1},
+            sort=[("next_attempt_at", ASCENDING)]
+        )
+        lag = (now - oldest["created_at"]).total_seconds() if oldest else 0.0
+        return {**depth, "lag_seconds": round(lag, 1)}
+
+
+class OutboxWorkerPool:
+    """Fixed number of threads draining the outbox; idle workers poll every `poll_seconds`."""
+
+    def __init__(
+        self,
+        outbox: EmailOutbox,
+        handlers: Dict[str, Callable[[Dict], None]],
+        size: int = Config.OUTBOX_WORKERS,
+        poll_seconds: float = 2.0
+    ):
+        self.outbox = outbox
+        self.handlers = handlers
+        self.size = size
+        self.poll_seconds = poll_seconds
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.size):
+            thread = threading.Thread(
+                target=self._run, args=(f"{self._prefix}:{i}",), name=f"outbox-worker-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Outbox worker pool started with {self.size} workers")
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self, worker_id: str):
+        while not self._stop.is_set():
+            try:
+                job = self.outbox.claim(worker_id)
+            except Exception as e:
+                logger.error(f"Outbox claim failed: {e}")
+                job = None
+            if job is None:
+                self._stop.wait(self.poll_seconds)
+                continue
+            self._process(job)
+
+    def _process(self, job: Dict):
+        handler = self.handlers.get(job["kind"])
+        try:
+            if handler is None:
+                raise ValueError(f"No handler for outbox job kind '{job['kind']}'")
+            handler(job["payload"])
+        except Exception as e:
+            self.outbox.fail(job, str(e))
+            return
+        self.outbox.complete(job)
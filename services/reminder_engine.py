@@ -0,0 +1,140 @@
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+from utils.config import Config
+from utils.reminder import ReminderManager
+from utils.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+# Longest backlog a single tick will replay
+MAX_TICK_MINUTES = 24 * 60
+
+
+class ReminderEngine:
+    """
+    Delivers every dose whose fire time passed since the previous tick, so a
+    late or skipped run does not lose that minute's reminders.
+
+    Due doses come from the reminder_fire_slots index, which ReminderManager
+    keeps in sync whenever a reminder is added, toggled or deleted; a tick is
+    a single point lookup per elapsed minute. Every delivery is claimed in the
+    notification log first, so replays and failovers never send twice.
+    All instants are naive UTC; slots already encode each user's timezone.
+
+    Doses for the same recipient that fall within `coalesce_minutes` of the
+    first due one are delivered together as one digest; later doses inside
+    that window are pulled forward and claimed so their own minute skips them.
+    """
+
+    def __init__(
+        self,
+        reminder_manager: ReminderManager,
+        deliver: Callable[[List[Dict]], None],
+        catchup_minutes: int = Config.REMINDER_CATCHUP_MINUTES,
+        coalesce_minutes: int = Config.REMINDER_COALESCE_MINUTES
+    ):
+        self.reminder_mgr = reminder_manager
+        self.deliver = deliver
+        self.coalesce = timedelta(minutes=max(coalesce_minutes, 0))
+        self._lock = threading.Lock()
+        self.last_tick = datetime.utcnow() - timedelta(minutes=catchup_minutes)
+        # Due doses whose delivery failed; retried on the next tick
+        self._failed: List[Dict] = []
+
+    def _elapsed_minutes(self, now: datetime) -> List[datetime]:
+        t = self.last_tick.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        instants = []
+        while t <= now:
+            instants.append(t)
+            t += timedelta(minutes=1)
+        return instants[-MAX_TICK_MINUTES:]
+
+    def _upcoming_minutes(self, now: datetime) -> List[datetime]:
+        start = now.replace(second=0, microsecond=0)
+        return [start + timedelta(minutes=i) for i in range(1, int(self.coalesce.total_seconds() // 60) + 1)]
+
+    def _group(self, due: List[Dict], upcoming: List[Dict], now: datetime) -> List[List[Dict]]:
+        """Split each recipient's doses into digests spanning at most the coalescing window"""
+        by_recipient = defaultdict(list)
+        for slot in due:
+            by_recipient[slot["notification_email"]].append(slot)
+        for slot in upcoming:
+            # Only ride along with a dose that is due now
+            if slot["notification_email"] in by_recipient:
+                by_recipient[slot["notification_email"]].append(slot)
+
+        groups = []
+        for slots in by_recipient.values():
+            slots.sort(key=lambda s: (s["fire_at"], s["medicine_name"]))
+            group = []
+            for slot in slots:
+                if group and slot["fire_at"] - group[0]["fire_at"] > self.coalesce:
+                    groups.append(group)
+                    group = []
+                group.append(slot)
+            groups.append(group)
+        # Pulled-forward doses that ended up without a due dose in front wait for their minute
+        return [g for g in groups if g[0]["fire_at"] <= now]
+
+    def tick(self, now: Optional[datetime] = None) -> int:
+        """Deliver all doses due in (last_tick, now]; returns how many emails were sent."""
+        now = now or datetime.utcnow()
+        with self._lock:
+            retry = self._take_failed(now)
+            try:
+                sent = self._deliver_due(retry, now)
+            except Exception:
+                # last_tick stays put, so fresh doses are re-read next tick; keep
+                # the earlier failures too (claims stop any double send)
+                pending = {(s["reminder_id"], s["fire_at"]): s for s in retry + self._failed}
+                self._failed = list(pending.values())
+                raise
+            self.last_tick = now
+            return sent
+
+    def _deliver_due(self, retry: List[Dict], now: datetime) -> int:
+        due = retry + [
+            s for s in self.reminder_mgr.get_due_slots(self._elapsed_minutes(now)) if s.get("notification_email")
+        ]
+        upcoming = []
+        if due and self.coalesce:
+            upcoming = [
+                s for s in self.reminder_mgr.get_due_slots(self._upcoming_minutes(now))
+                if s.get("notification_email")
+            ]
+
+        sent = 0
+        for group in self._group(due, upcoming, now):
+            claimed = [
+                slot for slot in group
+                if self.reminder_mgr.claim_notification(slot["reminder_id"], slot["fire_at"], slot["notification_email"])
+            ]
+            if not claimed:
+                continue
+            try:
+                self.deliver(claimed)
+                sent += 1
+            except Exception as e:
+                logger.error(f"Delivery failed for {len(claimed)} doses to {claimed[0]['notification_email']}: {e}")
+                self._release(claimed, now)
+        return sent
+
+    def _take_failed(self, now: datetime) -> List[Dict]:
+        # Give up on doses older than the longest backlog a tick would replay
+        oldest = now - timedelta(minutes=MAX_TICK_MINUTES)
+        failed, self._failed = self._failed, []
+        return [s for s in failed if s["fire_at"] >= oldest]
+
+    def _release(self, slots: List[Dict], now: datetime):
+        """Undo the claims of an undelivered group so its doses can be sent again"""
+        for slot in slots:
+            try:
+                self.reminder_mgr.release_notification(slot["reminder_id"], slot["fire_at"])
+            except Exception as e:
+                logger.error(f"Could not release notification claim for {slot['reminder_id']} at {slot['fire_at']}: {e}")
+                continue
+            # Pulled-forward doses come round again at their own minute
+            if slot["fire_at"] <= now:
+                self._failed.append(slot)
@@ -1,19 +1,50 @@
 from apscheduler.schedulers.background import BackgroundScheduler
+from services.leader import LeaderLease
 from services.mail_service import MailService
+from services.outbox import OutboxWorkerPool
 from utils.reminder import ReminderManager
+from utils.retention import RetentionManager
+from services.reminder_engine import ReminderEngine
+from utils.config import Config
 from utils.utils import setup_logger
 import atexit
+import time
 
 logger = setup_logger(__name__)
 
 class SchedulerService:
     def __init__(self):
+        self.mail_svc = MailService()
+        self.reminder_mgr = ReminderManager()
+        self.retention = RetentionManager()
+        self.engine = None
+        self.lease = LeaderLease("reminder_scheduler")
+        # Outbox claims are atomic, so every process drains it, leader or not
+        self.outbox_workers = OutboxWorkerPool(self.mail_svc.outbox, self.mail_svc.handlers)
+        if self.mail_svc.enabled:
+            self.outbox_workers.start()
         self.scheduler = BackgroundScheduler()
         self.scheduler.start()
-        atexit.register(lambda: self.scheduler.shutdown())
+        atexit.register(self.shutdown)
         self._add_jobs()
+        self._renew_lease()
+
+    def shutdown(self):
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+            self.lease.release()
+            self.outbox_workers.stop()
+            self.mail_svc.pool.close()
         
     def _add_jobs(self):
+        # Every process competes for the lease; only the holder runs the jobs below
+        self.scheduler.add_job(
+            func=self._renew_lease,
+            trigger="interval",
+            seconds=max(Config.SCHEDULER_LEASE_SECONDS // 3, 5),
+            id="scheduler_lease",
+            replace_existing=True
+        )
         # Check for medication reminders every minute
         self.scheduler.add_job(
             func=self._check_reminders,
@@ -22,38 +53,75 @@ class SchedulerService:
             id="medication_reminders",
             replace_existing=True
         )
+        # Nightly compaction of cold history into the archive
+        self.scheduler.add_job(
+            func=self._run_retention,
+            trigger="cron",
+            hour=3,
+            id="history_retention",
+            replace_existing=True
+        )
+        # Outbox depth/lag, logged by the leader only
+        self.scheduler.add_job(
+            func=self._report_outbox,
+            trigger="interval",
+            minutes=5,
+            id="outbox_metrics",
+            replace_existing=True
+        )
         logger.info("Scheduler started: Medication reminder job added.")
 
+    def _renew_lease(self):
+        was_leader = self.lease.is_leader
+        if self.lease.acquire_or_renew() and not was_leader:
+            # Fresh engine: catch-up window plus the notification log cover the handover
+            self.engine = ReminderEngine(self.reminder_mgr, self._deliver)
+
+    def _run_retention(self):
+        if not self.lease.is_leader:
+            return
+        try:
+            self.retention.run(mode="archive")
+        except Exception as e:
+            logger.error(f"Retention Job Error: {e}")
+
+    def _report_outbox(self):
+        if not self.lease.is_leader:
+            return
+        try:
+            stats = self.mail_svc.outbox.stats()
+            if stats['dead'] or stats['lag_seconds'] > 300:
+                logger.warning(f"Email outbox backlog: {stats}")
+            else:
+                logger.info(f"Email outbox: {stats}")
+        except Exception as e:
+            logger.error(f"Outbox Metrics Error: {e}")
+
     def _check_reminders(self):
         try:
-            # Re-instantiate managers to ensure thread safety / fresh db connection if needed
-            reminder_mgr = ReminderManager()
-            mail_svc = MailService()
-            
-            if not mail_svc.enabled:
+            if not self.mail_svc.enabled or not self.lease.is_leader or self.engine is None:
                 return
 
-            due_reminders = reminder_mgr.check_due_reminders()
-            
-            if due_reminders:
-                logger.info(f"Found {len(due_reminders)} due reminders.")
-            
-            for reminder in due_reminders:
-                recipient = reminder.get('notification_email')
-                if recipient:
-                    success = mail_svc.send_dose_reminder(
-                        recipient,
-                        reminder['medicine_name'],
-                        reminder['dosage'],
-                        reminder.get('instructions', ''),
-                        # Since check_due_reminders returns active ones matching current time,
-                        # we can pass current time or the matched time. 
-                        # Ideally check_due_reminders should return the specific time matched.
-                        # For now, let's assume the reminder logic handles timing checks correctly.
-                        # Wait, ReminderManager.check_due_reminders checks current time against "times" list.
-                        # It returns the whole reminder doc. 
-                        # We'll just pass the current HH:MM string.
-                        reminder.get('current_match_time', 'NOW') 
-                    )
+            sent = self.engine.tick()
+            if sent:
+                logger.info(f"Queued {sent} dose reminder emails. SMTP pool: {self.mail_svc.pool_stats()}")
         except Exception as e:
             logger.error(f"Scheduler Job Error: {e}")
+
+    def _deliver(self, slots):
+        self.mail_svc.send_due_doses(slots)
+
+
+def main():
+    """Standalone scheduler process, e.g. a `worker:` Procfile entry."""
+    service = SchedulerService()
+    logger.info("Standalone scheduler running. Press Ctrl+C to exit.")
+    try:
+        while True:
+            time.sleep(60)
+    except (KeyboardInterrupt, SystemExit):
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import smtplib
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+from utils.config import Config
+from utils.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+# Errors after which the connection is discarded and the send retried once.
+# (SMTPException subclasses OSError, so recipient/content errors must not match.)
+DROPPED_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+def _connection_dropped(error: Exception) -> bool:
+    # 421: the server is closing the channel (e.g. its own per-session limit)
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code == 421
+    return isinstance(error, DROPPED_ERRORS)
+
+
+class _PooledConnection:
+    def __init__(self, smtp: smtplib.SMTP):
+        self.smtp = smtp
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+    def close(self):
+        try:
+            self.smtp.quit()
+        except Exception:
+            try:
+                self.smtp.close()
+            except Exception:
+                pass
+
+
+class SMTPPool:
+    """
+    A handful of authenticated SMTP connections shared by all senders.
+
+    Idle connections are reused most-recent-first. A connection is retired
+    after `max_messages` sends or `idle_seconds` without use (servers drop
+    idle sessions anyway), and one the server has closed is replaced with
+    a fresh login and the message retried once.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: str,
+        password: str,
+        security: str = Config.SMTP_SECURITY,
+        size: int = Config.SMTP_POOL_SIZE,
+        max_messages: int = Config.SMTP_MAX_MESSAGES_PER_CONNECTION,
+        idle_seconds: int = Config.SMTP_IDLE_SECONDS,
+        timeout: int = 30
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.security = security
+        self.max_messages = max_messages
+        self.idle_seconds = idle_seconds
+        self.timeout = timeout
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._metrics = {
+            "sent": 0, "failed": 0, "reused": 0, "opened": 0,
+            "retired": 0, "reconnects": 0, "latency_total": 0.0, "latency_max": 0.0
+        }
+
+    def send(self, msg) -> None:
+        """Send one message on a pooled connection; raises if the retry also fails"""
+        started = time.monotonic()
+        with self._slots:
+            try:
+                self._send_on(self._checkout(), msg)
+            except Exception:
+                self._count("failed")
+                raise
+
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._metrics["sent"] += 1
+            self._metrics["latency_total"] += elapsed
+            self._metrics["latency_max"] = max(self._metrics["latency_max"], elapsed)
+        logger.debug(f"SMTP send took {elapsed * 1000:.0f} ms")
+
+    def _send_on(self, conn: _PooledConnection, msg):
+        """
+        Send on `conn`, reconnecting once if the server dropped it. The
+        connection that did the work goes back to the pool unless the
+        failure was at the connection level.
+        """
+        try:
+            conn.smtp.send_message(msg)
+        except Exception as e:
+            if not _connection_dropped(e):
+                self._discard_or_release(conn, e)
+                raise
+            logger.info(f"SMTP connection dropped ({e}); reconnecting")
+            conn.close()
+            self._count("reconnects")
+            conn = self._connect()
+            try:
+                conn.smtp.send_message(msg)
+            except Exception as retry_error:
+                self._discard_or_release(conn, retry_error)
+                raise
+        self._release(conn, sent=True)
+
+    def _discard_or_release(self, conn: _PooledConnection, error: Exception):
+        # Refused recipients or rejected content leave the session usable;
+        # anything at the connection level does not
+        if isinstance(error, smtplib.SMTPException) and not _connection_dropped(error):
+            self._release(conn)
+        else:
+            conn.close()
+            self._count("retired")
+
+    def _release(self, conn: _PooledConnection, sent: bool = False):
+        if sent:
+            conn.sent += 1
+        conn.last_used = time.monotonic()
+        self._checkin(conn)
+
+    def stats(self) -> Dict:
+        """Send counts, mean/max latency (ms) and connection reuse rate"""
+        with self._lock:
+            m = dict(self._metrics)
+            idle = len(self._idle)
+        attempts = m["reused"] + m["opened"]
+        return {
+            "sent": m["sent"],
+            "failed": m["failed"],
+            "connections_opened": m["opened"],
+            "connections_retired": m["retired"],
+            "reconnects": m["reconnects"],
+            "idle_connections": idle,
+            "reuse_rate": round(m["reused"] / attempts * 100, 1) if attempts else 0.0,
+            "avg_latency_ms": round(m["latency_total"] / m["sent"] * 1000, 1) if m["sent"] else 0.0,
+            "max_latency_ms": round(m["latency_max"] * 1000, 1)
+        }
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn in idle:
+            conn.close()
+
+    def _checkout(self) -> _PooledConnection:
+        now = time.monotonic()
+        stale = []
+        conn: Optional[_PooledConnection] = None
+        with self._lock:
+            while self._idle:
+                candidate = self._idle.pop()
+                if now - candidate.last_used > self.idle_seconds:
+                    stale.append(candidate)
+                    continue
+                conn = candidate
+                self._metrics["reused"] += 1
+                break
+        for old in stale:
+            old.close()
+        if stale:
+            self._count("retired", len(stale))
+        return conn or self._connect()
+
+    def _checkin(self, conn: _PooledConnection):
+        if conn.sent >= self.max_messages:
+            conn.close()
+            self._count("retired")
+            return
+        with self._lock:
+            self._idle.append(conn)
+
+    def _connect(self) -> _PooledConnection:
+        if self.security == "ssl":
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.security == "starttls":
+                smtp.starttls()
+            smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        self._count("opened")
+        return _PooledConnection(smtp)
+
+    def _count(self, key: str, n: int = 1):
+        with self._lock:
+            self._metrics[key] += n
@@ -1,5 +1,6 @@
 import re
 from datetime import datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 class Validator:
     @staticmethod
@@ -25,8 +26,28 @@ class Validator:
         if data.get('notification_email') and not re.match(r"[^@]+@[^@]+\.[^@]+", data['notification_email']):
             errors.append("Invalid email format.")
 
+        if data.get('timezone'):
+            try:
+                ZoneInfo(data['timezone'])
+            except (ZoneInfoNotFoundError, ValueError):
+                errors.append(f"Unknown timezone: {data['timezone']}.")
+
         return errors
 
+    @staticmethod
+    def validate_medication_batch(items, common):
+        """
+        Validate several medication entries sharing `common` fields
+        (start_date, notifications, timezone). Returns {index: [errors]}
+        for invalid entries only.
+        """
+        results = {}
+        for i, item in enumerate(items):
+            errors = Validator.validate_medication_input({**common, **item})
+            if errors:
+                results[i] = errors
+        return results
+
     @staticmethod
     def validate_login(username, password):
         if not username or not password:
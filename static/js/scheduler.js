@@ -47,6 +47,16 @@ document.addEventListener('DOMContentLoaded', function() {
         feather.replace();
     }
     
+    // Reminder times are local to the browser's timezone
+    const tzInput = document.getElementById('timezone');
+    if (tzInput) {
+        try {
+            tzInput.value = Intl.DateTimeFormat().resolvedOptions().timeZone || '';
+        } catch (e) {
+            tzInput.value = '';
+        }
+    }
+
     // Client-side Form Validation
     const form = document.getElementById('medication-form');
     if (form) {
@@ -0,0 +1,29 @@
+import pytest
+from utils.reminder import parse_duration_days
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("5 days", 5),
+    ("2 weeks", 14),
+    ("1 month", 30),
+    ("for 3 wks", 21),
+    ("10", 10),
+    (7, 7),
+])
+def test_units(text, expected):
+    assert parse_duration_days(text, default=30) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1-2 weeks", 14),
+    ("2 to 3 weeks", 21),
+    ("5 - 7 days", 7),
+    ("1 or 2 months", 60),
+])
+def test_ranges_use_upper_bound(text, expected):
+    assert parse_duration_days(text, default=30) == expected
+
+
+@pytest.mark.parametrize("text", ["10 tablets", "take 2 daily", "0", "as needed", "", None, 0])
+def test_without_unit_falls_back_to_default(text):
+    assert parse_duration_days(text, default=30) == 30
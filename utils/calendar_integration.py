@@ -1,5 +1,6 @@
 from datetime import datetime, timedelta
 from typing import Optional, Dict
+from utils.config import Config
 from utils.utils import setup_logger
 
 logger = setup_logger(__name__)
@@ -64,7 +65,8 @@ class CalendarIntegration:
         reminder_time: str,
         start_date: str,
         duration_days: int,
-        instructions: Optional[str] = None
+        instructions: Optional[str] = None,
+        timezone: Optional[str] = None
     ) -> Dict:
         if not self.service:
             if not self.authenticate():
@@ -75,6 +77,7 @@ class CalendarIntegration:
             end_datetime = start_datetime + timedelta(minutes=15)
             end_date = datetime.strptime(start_date, "%Y-%m-%d") + timedelta(days=duration_days)
             
+            tz_name = timezone or Config.DEFAULT_TIMEZONE
             description = f"Take {dosage}"
             if instructions:
                 description += f"\n\nInstructions: {instructions}"
@@ -84,11 +87,11 @@ class CalendarIntegration:
                 'description': description,
                 'start': {
                     'dateTime': start_datetime.isoformat(),
-                    'timeZone': 'Asia/Kolkata',
+                    'timeZone': tz_name,
                 },
                 'end': {
                     'dateTime': end_datetime.isoformat(),
-                    'timeZone': 'Asia/Kolkata',
+                    'timeZone': tz_name,
                 },
                 'recurrence': [
                     f'RRULE:FREQ=DAILY;UNTIL={end_date.strftime("%Y%m%d")}T235959Z'
@@ -123,12 +126,13 @@ class CalendarIntegration:
         times: list,
         start_date: str,
         duration_days: int,
-        instructions: Optional[str] = None
+        instructions: Optional[str] = None,
+        timezone: Optional[str] = None
     ) -> Dict:
         results = []
         for time in times:
             result = self.create_reminder_event(
-                medicine_name, dosage, time, start_date, duration_days, instructions
+                medicine_name, dosage, time, start_date, duration_days, instructions, timezone
             )
             results.append(result)
         
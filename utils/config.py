@@ -16,9 +16,62 @@ class Config:
     INPUT_DIR = os.path.join(DATA_DIR, "input")
     PROCESSED_DIR = os.path.join(DATA_DIR, "processed")
     
+    # Retention: raw messages/adherence logs older than this move to the archive
+    RETENTION_HOT_DAYS = int(os.getenv("RETENTION_HOT_DAYS", "90"))
+    ARCHIVE_DIR = os.path.join(DATA_DIR, "archive")
+
+    # IANA timezone for reminders and calendar events that don't specify one
+    DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "Asia/Kolkata")
+
+    # Default clock times for prescription slots when creating reminders from an extraction,
+    # e.g. REMINDER_SLOT_TIMES="morning=08:00,afternoon=14:00,night=21:00"
+    REMINDER_SLOT_TIMES = dict(
+        pair.split("=", 1) for pair in
+        os.getenv("REMINDER_SLOT_TIMES", "morning=08:00,afternoon=14:00,night=21:00").split(",")
+        if "=" in pair
+    )
+    DEFAULT_REMINDER_DAYS = int(os.getenv("DEFAULT_REMINDER_DAYS", "7"))
+
+    # Scheduler: doses missed by up to this many minutes (e.g. across a restart) are still sent
+    REMINDER_CATCHUP_MINUTES = int(os.getenv("REMINDER_CATCHUP_MINUTES", "30"))
+    # Doses for one recipient due within this many minutes go out as a single digest email
+    REMINDER_COALESCE_MINUTES = int(os.getenv("REMINDER_COALESCE_MINUTES", "5"))
+
+    # Only the process holding the scheduler lease runs reminder jobs.
+    # Set RUN_SCHEDULER_IN_WEB=false when running `python -m services.scheduler` separately.
+    RUN_SCHEDULER_IN_WEB = os.getenv("RUN_SCHEDULER_IN_WEB", "true").lower() == "true"
+    SCHEDULER_LEASE_SECONDS = int(os.getenv("SCHEDULER_LEASE_SECONDS", "90"))
+
+    # Geocoding cache: in-process LRU size, TTL for found addresses and for misses
+    GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", "2048"))
+    GEOCODE_TTL_DAYS = int(os.getenv("GEOCODE_TTL_DAYS", "90"))
+    GEOCODE_NEGATIVE_TTL_HOURS = int(os.getenv("GEOCODE_NEGATIVE_TTL_HOURS", "6"))
+    # Hedged geocoding: start the next provider if no answer within this delay
+    GEOCODE_HEDGE_DELAY_MS = int(os.getenv("GEOCODE_HEDGE_DELAY_MS", "1200"))
+    GEOCODE_MAX_WORKERS = int(os.getenv("GEOCODE_MAX_WORKERS", "8"))
+    # Overpass pharmacy results are cached per geohash tile for this long
+    PHARMACY_TILE_TTL_HOURS = int(os.getenv("PHARMACY_TILE_TTL_HOURS", "24"))
+    # Offline pharmacy indexes built by scripts/import_osm_pharmacies.py
+    PHARMACY_INDEX_DIR = os.getenv("PHARMACY_INDEX_DIR", os.path.join(DATA_DIR, "osm_index"))
+
     # Email Config
     EMAIL_SENDER = os.getenv("EMAIL_SENDER")
     EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
+    # SMTP relay for MailService and EmailManager. SMTP_SECURITY is starttls, ssl,
+    # or none (plain, e.g. the local sink in scripts/smtp_sink.py)
+    SMTP_HOST = os.getenv("SMTP_HOST", os.getenv("SMTP_SERVER", "smtp.gmail.com"))
+    SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+    SMTP_SECURITY = os.getenv("SMTP_SECURITY", "ssl" if SMTP_PORT == 465 else "starttls").lower()
+    # Pooled SMTP connections shared by all outgoing mail
+    SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "3"))
+    SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", "90"))
+    SMTP_IDLE_SECONDS = int(os.getenv("SMTP_IDLE_SECONDS", "240"))
+    # Durable email outbox: workers per process, retries before dead-lettering,
+    # first retry delay (doubles each attempt), and how long a claimed job is held
+    OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", str(SMTP_POOL_SIZE)))
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "6"))
+    OUTBOX_BACKOFF_SECONDS = int(os.getenv("OUTBOX_BACKOFF_SECONDS", "30"))
+    OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "120"))
 
     @staticmethod
     def get_tls_kwargs():
@@ -1,21 +1,79 @@
 import smtplib
 import os
-import pandas as pd
+import io
+import csv
+import gzip
+import base64
 import logging
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
 from datetime import datetime
-from typing import List, Dict, Optional, Union
+from typing import Iterable, List, Dict, Optional, Union
 from utils.config import Config
+from utils.email_templates import render_email
 
 logger = logging.getLogger(__name__)
 
+REPORT_FIELDS = ['medicine_name', 'dosage', 'times', 'total_doses', 'taken', 'missed', 'adherence']
+LOG_FIELDS = ['date', 'scheduled_time', 'time_slot', 'medicine_name', 'status', 'actual_time', 'reason']
+
+# 57 raw bytes encode to one 76-character base64 line (RFC 2045)
+B64_LINE_BYTES = 57
+
+
+class _Base64Writer(io.RawIOBase):
+    """Binary sink that base64-encodes as it is written, keeping only the encoded lines."""
+
+    def __init__(self):
+        self._pending = b""
+        self._lines = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._pending += bytes(data)
+        usable = len(self._pending) - len(self._pending) % B64_LINE_BYTES
+        for i in range(0, usable, B64_LINE_BYTES):
+            self._lines.append(base64.b64encode(self._pending[i:i + B64_LINE_BYTES]).decode("ascii"))
+        self._pending = self._pending[usable:]
+        return len(data)
+
+    def getvalue(self) -> str:
+        lines = self._lines + ([base64.b64encode(self._pending).decode("ascii")] if self._pending else [])
+        return "\n".join(lines) + "\n"
+
+
+def build_csv_attachment(rows: Iterable[Dict], fieldnames: List[str], filename: str, compress: bool = False) -> MIMEBase:
+    """
+    CSV attachment written row by row from any iterable (e.g. a Mongo cursor)
+    and base64-encoded on the fly, optionally gzipped; the plain CSV is never
+    held in memory.
+    """
+    encoded = _Base64Writer()
+    raw = gzip.GzipFile(filename=filename, mode="wb", fileobj=encoded) if compress else encoded
+    text = io.TextIOWrapper(raw, encoding="utf-8", newline="", write_through=True)
+    writer = csv.DictWriter(text, fieldnames=fieldnames, extrasaction="ignore")
+    writer.writeheader()
+    for row in rows:
+        writer.writerow({k: ", ".join(v) if isinstance(v, list) else v for k, v in row.items()})
+    text.detach()
+    if compress:
+        raw.close()
+
+    part = MIMEBase("application", "gzip") if compress else MIMEBase("text", "csv", charset="utf-8")
+    part.set_payload(encoded.getvalue())
+    part["Content-Transfer-Encoding"] = "base64"
+    part.add_header("Content-Disposition", "attachment", filename=filename + (".gz" if compress else ""))
+    return part
+
 class EmailManager:
     def __init__(self):
-        self.smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-        self.smtp_port = int(os.getenv("SMTP_PORT", "465"))
+        self.smtp_server = Config.SMTP_HOST
+        self.smtp_port = Config.SMTP_PORT
+        self.smtp_security = Config.SMTP_SECURITY
         self.sender_email = os.getenv("MAIL_USERNAME")
         self.sender_password = os.getenv("MAIL_PASSWORD")
         self.enabled = bool(self.sender_email and self.sender_password)
@@ -23,16 +81,27 @@ class EmailManager:
         if not self.enabled:
             logger.warning("EmailManager disabled: MAIL_USERNAME or MAIL_PASSWORD not set in .env")
 
+    def _connect(self):
+        if self.smtp_security == "ssl":
+            return smtplib.SMTP_SSL(self.smtp_server, self.smtp_port, timeout=30)
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=30)
+        if self.smtp_security == "starttls":
+            server.starttls()
+        return server
+
     def send_email(
         self, 
         recipient_email: str, 
         subject: str, 
         body: str, 
         attachment_path: Optional[str] = None,
-        is_html: bool = True
+        is_html: bool = True,
+        attachment: Optional[MIMEBase] = None,
+        text_body: Optional[str] = None
     ) -> Dict[str, Union[bool, str]]:
         """
-        Send a generic email with optional attachment.
+        Send a generic email with optional attachment. With `text_body`, the
+        HTML body goes out as multipart/alternative with that plain-text version.
         """
         if not self.enabled:
             return {"success": False, "error": "Email configuration missing"}
@@ -44,7 +113,13 @@ class EmailManager:
             message['Subject'] = subject
 
             msg_type = 'html' if is_html else 'plain'
-            message.attach(MIMEText(body, msg_type))
+            if text_body is not None:
+                alternative = MIMEMultipart('alternative')
+                alternative.attach(MIMEText(text_body, 'plain'))
+                alternative.attach(MIMEText(body, msg_type))
+                message.attach(alternative)
+            else:
+                message.attach(MIMEText(body, msg_type))
 
             if attachment_path and os.path.exists(attachment_path):
                 with open(attachment_path, 'rb') as attachment:
@@ -59,7 +134,10 @@ class EmailManager:
                 )
                 message.attach(part)
 
-            with smtplib.SMTP_SSL(self.smtp_server, self.smtp_port) as server:
+            if attachment is not None:
+                message.attach(attachment)
+
+            with self._connect() as server:
                 server.login(self.sender_email, self.sender_password)
                 server.sendmail(self.sender_email, recipient_email, message.as_string())
             
@@ -74,82 +152,38 @@ class EmailManager:
         self, 
         recipient_email: str, 
         stats_data: Dict, 
-        user_name: Optional[str] = "User"
+        user_name: Optional[str] = "User",
+        logs: Optional[Iterable[Dict]] = None,
+        compress: bool = False
     ) -> Dict[str, Union[bool, str]]:
         """
-        Generate a CSV report from stats and send it.
+        Generate a CSV report and send it. The CSV holds the per-medicine
+        summary, or every dose when `logs` (e.g. ReminderManager.iter_adherence_logs)
+        is given; `compress` gzips the attachment.
         """
         if not self.enabled:
             return {"success": False, "error": "Email configuration missing"}
             
         try:
-            # Create a DataFrame for detailed stats
             details = stats_data.get('reminder_details', [])
-            if not details:
+            if not details and logs is None:
                 return {"success": False, "error": "No data to report"}
-                
-            df = pd.DataFrame(details)
             
-            # Format filename
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"medimate_adherence_report_{timestamp}.csv"
+            if logs is not None:
+                attachment = build_csv_attachment(logs, LOG_FIELDS, filename, compress)
+            else:
+                attachment = build_csv_attachment(details, REPORT_FIELDS, filename, compress)
             
-            # Use a temporary directory or media root
-            # Assuming src/../data exists or similar
-            report_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'reports')
-            os.makedirs(report_dir, exist_ok=True)
-            file_path = os.path.join(report_dir, filename)
-            
-            df.to_csv(file_path, index=False)
-            
-            # Create Email Body
-            body = f"""
-            <html>
-            <body>
-                <h2>💊 pharmEZ Adherence Report</h2>
-                <p>Hello {user_name},</p>
-                <p>Here is your medication adherence summary for the last {stats_data.get('period_days', 7)} days.</p>
-                
-                <table style="border-collapse: collapse; width: 100%; max_width: 600px;">
-                    <tr style="background-color: #f2f2f2;">
-                        <th style="padding: 10px; border: 1px solid #ddd;">Metric</th>
-                        <th style="padding: 10px; border: 1px solid #ddd;">Value</th>
-                    </tr>
-                    <tr>
-                        <td style="padding: 10px; border: 1px solid #ddd;">Total Doses</td>
-                        <td style="padding: 10px; border: 1px solid #ddd;">{stats_data.get('total_doses')}</td>
-                    </tr>
-                    <tr>
-                        <td style="padding: 10px; border: 1px solid #ddd;">Taken</td>
-                        <td style="padding: 10px; border: 1px solid #ddd; color: green;">{stats_data.get('taken_count')}</td>
-                    </tr>
-                     <tr>
-                        <td style="padding: 10px; border: 1px solid #ddd;">Missed</td>
-                        <td style="padding: 10px; border: 1px solid #ddd; color: red;">{stats_data.get('missed_count')}</td>
-                    </tr>
-                    <tr>
-                        <td style="padding: 10px; border: 1px solid #ddd;">Adherence Rate</td>
-                        <td style="padding: 10px; border: 1px solid #ddd;"><strong>{stats_data.get('adherence_rate')}%</strong></td>
-                    </tr>
-                </table>
-                
-                <p>A detailed CSV report is attached.</p>
-                <p>Stay healthy,<br>pharmEZ Team</p>
-            </body>
-            </html>
-            """
-            
-            result = self.send_email(
+            body, text_body = render_email("adherence_report", stats=stats_data, user_name=user_name)
+            return self.send_email(
                 recipient_email, 
                 "Your pharmEZ Adherence Report", 
                 body, 
-                file_path
+                attachment=attachment,
+                text_body=text_body
             )
-            
-            # Clean up (optional, maybe keep for debug?)
-            # os.remove(file_path) 
-            
-            return result
 
         except Exception as e:
             logger.error(f"Failed to generate/send report: {str(e)}")
@@ -165,24 +199,10 @@ class EmailManager:
     ):
         """Send a quick email reminder for a dose"""
         subject = f"🔔 Time to take {medicine_name}"
-        body = f"""
-        <html>
-        <body>
-            <div style="font-family: Arial, sans-serif; padding: 20px; border: 1px solid #eee; border-radius: 10px;">
-                <h2 style="color: #2c3e50;">Time for your Medication</h2>
-                <div style="background-color: #f8f9fa; padding: 15px; border-radius: 5px; margin: 15px 0;">
-                    <h3 style="margin: 0; color: #16a085;">💊 {medicine_name}</h3>
-                    <p style="margin: 5px 0 0 0; font-size: 16px;"><strong>Dose:</strong> {dosage}</p>
-                </div>
-                
-                <p><strong>Scheduled Time:</strong> {time}</p>
-                {f'<p><strong>Instructions:</strong> {instructions}</p>' if instructions else ''}
-                
-                <p style="margin-top: 20px; font-size: 12px; color: #7f8c8d;">
-                    Stay consistent! Log this dose in your pharmEZ app.
-                </p>
-            </div>
-        </body>
-        </html>
-        """
-        return self.send_email(recipient_email, subject, body)
+        body, text_body = render_email("dose_reminder", dose={
+            "medicine_name": medicine_name,
+            "dosage": dosage,
+            "instructions": instructions,
+            "time_str": time
+        })
+        return self.send_email(recipient_email, subject, body, text_body=text_body)
@@ -0,0 +1,65 @@
+import os
+import tempfile
+from typing import Tuple
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+from utils.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates', 'email')
+BYTECODE_DIR = os.getenv("EMAIL_TEMPLATE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "pharmez_email_templates"))
+
+
+class EmailTemplates:
+    """
+    Jinja templates under templates/email, shared by MailService and
+    EmailManager. Every message has `<name>.html` and `<name>.txt`; files
+    starting with "_" are layouts/partials.
+
+    All templates are compiled once at start-up (compiled bytecode is cached
+    on disk for the next process), so a send only pays for rendering.
+    """
+
+    def __init__(self, template_dir: str = TEMPLATE_DIR, bytecode_dir: str = BYTECODE_DIR):
+        bytecode_cache = None
+        try:
+            os.makedirs(bytecode_dir, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(bytecode_dir)
+        except OSError as e:
+            logger.warning(f"Email template bytecode cache disabled: {e}")
+
+        loader = FileSystemLoader(template_dir)
+        # Templates never change at runtime, so skip the per-render mtime check
+        options = dict(loader=loader, bytecode_cache=bytecode_cache, auto_reload=False, cache_size=-1)
+        self.html_env = Environment(autoescape=select_autoescape(["html"]), **options)
+        self.text_env = Environment(autoescape=False, keep_trailing_newline=True, **options)
+
+        self._html = {}
+        self._text = {}
+        for filename in sorted(os.listdir(template_dir)):
+            name, ext = os.path.splitext(filename)
+            if name.startswith("_"):
+                continue
+            if ext == ".html":
+                self._html[name] = self.html_env.get_template(filename)
+            elif ext == ".txt":
+                self._text[name] = self.text_env.get_template(filename)
+
+    def render(self, name: str, **context) -> Tuple[str, str]:
+        """(html, text) bodies for the named message"""
+        return self._html[name].render(**context), self._text[name].render(**context)
+
+
+_templates = None
+
+
+def get_email_templates() -> EmailTemplates:
+    """Process-wide template set, compiled on first use."""
+    global _templates
+    if _templates is None:
+        _templates = EmailTemplates()
+    return _templates
+
+
+def render_email(name: str, **context) -> Tuple[str, str]:
+    return get_email_templates().render(name, **context)
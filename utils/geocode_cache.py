@@ -0,0 +1,131 @@
+import re
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+from pymongo import MongoClient
+from utils.config import Config
+from utils.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+# Sentinel for "looked up before, no provider found it"
+NOT_FOUND = "not_found"
+
+
+def normalize_address(address: str) -> str:
+    """Case/punctuation/whitespace-insensitive cache key: ' New  Delhi. ' -> 'new delhi'"""
+    key = re.sub(r"[^\w\s,]", " ", address.lower())
+    key = re.sub(r"\s*,\s*", ", ", key)
+    return re.sub(r"\s+", " ", key).strip(" ,")
+
+
+class GeocodeCache:
+    """
+    Two-level cache of address -> (lat, lon): an in-process LRU in front of
+    the medimate.geocode_cache collection, which a TTL index expires.
+
+    Hits are cached for GEOCODE_TTL_DAYS; misses (every provider answered
+    "no match") for GEOCODE_NEGATIVE_TTL_HOURS, so typos do not hammer the
+    providers. Lookups that failed on network errors are never cached.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = Config.GEOCODE_CACHE_SIZE,
+        ttl_days: int = Config.GEOCODE_TTL_DAYS,
+        negative_ttl_hours: int = Config.GEOCODE_NEGATIVE_TTL_HOURS
+    ):
+        self.max_entries = max_entries
+        self.ttl = timedelta(days=ttl_days)
+        self.negative_ttl = timedelta(hours=negative_ttl_hours)
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: defaultdict(int))
+
+        self.entries = None
+        try:
+            self.client = MongoClient(Config.MONGO_URI, **Config.get_tls_kwargs())
+            self.entries = self.client['medimate']['geocode_cache']
+            self.entries.create_index("expires_at", name="expires_at_ttl", expireAfterSeconds=0)
+        except Exception as e:
+            logger.warning(f"Geocode cache running in-process only: {e}")
+
+    def get(self, address: str):
+        """
+        (lat, lon) on a hit, NOT_FOUND on a cached miss, None when unknown.
+        """
+        key = normalize_address(address)
+        now = datetime.utcnow()
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry and entry["expires_at"] > now:
+                self._lru.move_to_end(key)
+                self._record(entry, "memory")
+                return self._value(entry)
+
+        entry = None
+        if self.entries is not None:
+            try:
+                entry = self.entries.find_one({"_id": key, "expires_at": {"$gt": now}})
+            except Exception as e:
+                logger.warning(f"Geocode cache read failed: {e}")
+        if entry:
+            self._remember(key, entry)
+            with self._lock:
+                self._record(entry, "mongo")
+            return self._value(entry)
+
+        with self._lock:
+            self._stats["_cache"]["misses"] += 1
+        return None
+
+    def put(self, address: str, coords: Optional[Tuple[float, float]], provider: Optional[str] = None):
+        """Cache a provider's answer, or a confirmed miss when coords is None."""
+        key = normalize_address(address)
+        now = datetime.utcnow()
+        entry = {
+            "found": coords is not None,
+            "lat": coords[0] if coords else None,
+            "lon": coords[1] if coords else None,
+            "provider": provider,
+            "cached_at": now,
+            "expires_at": now + (self.ttl if coords else self.negative_ttl)
+        }
+        self._remember(key, entry)
+        if self.entries is not None:
+            try:
+                self.entries.update_one({"_id": key}, {"$set": entry}, upsert=True)
+            except Exception as e:
+                logger.warning(f"Geocode cache write failed: {e}")
+
+    def record_call(self, provider: str, outcome: str):
+        """Count a live provider call: outcome is 'success', 'no_match' or 'error'."""
+        with self._lock:
+            self._stats[provider][outcome] += 1
+
+    def stats(self) -> Dict:
+        """Per-provider live calls and cache hits, plus overall cache hit/miss counts"""
+        with self._lock:
+            stats = {name: dict(counts) for name, counts in self._stats.items()}
+            stats["_cache"] = dict(stats.get("_cache", {}), entries=len(self._lru))
+        return stats
+
+    def _remember(self, key: str, entry: Dict):
+        with self._lock:
+            self._lru[key] = entry
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def _record(self, entry: Dict, level: str):
+        # Called with self._lock held
+        provider = entry.get("provider") or "negative"
+        self._stats[provider][f"{level}_hits"] += 1
+        self._stats["_cache"][f"{level}_hits"] += 1
+
+    @staticmethod
+    def _value(entry: Dict):
+        if not entry.get("found"):
+            return NOT_FOUND
+        return (entry["lat"], entry["lon"])
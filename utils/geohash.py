@@ -0,0 +1,83 @@
+from math import cos, radians
+from typing import List, Tuple
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+DECODE = {c: i for i, c in enumerate(BASE32)}
+
+METERS_PER_DEGREE_LAT = 111320.0
+
+
+def encode(lat: float, lon: float, precision: int = 5) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, coord = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def bbox(geohash: str) -> Tuple[float, float, float, float]:
+    """(south, west, north, east) of a geohash cell"""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = DECODE[char]
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if (value >> shift) & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """(lat_degrees, lon_degrees) spanned by one cell at this precision"""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def _distance_to_cell_m(lat: float, lon: float, cell: Tuple[float, float, float, float]) -> float:
+    # Equirectangular distance from the point to the nearest point of the cell; fine at city scale
+    south, west, north, east = cell
+    dlat = max(south - lat, 0.0, lat - north)
+    dlon = max(west - lon, 0.0, lon - east)
+    return ((dlat * METERS_PER_DEGREE_LAT) ** 2 + (dlon * METERS_PER_DEGREE_LAT * cos(radians(lat))) ** 2) ** 0.5
+
+
+def covering(lat: float, lon: float, radius_m: float, precision: int) -> List[str]:
+    """Geohash cells at `precision` that intersect the circle around (lat, lon)"""
+    dlat = radius_m / METERS_PER_DEGREE_LAT
+    dlon = radius_m / (METERS_PER_DEGREE_LAT * max(cos(radians(lat)), 0.01))
+    step_lat, step_lon = cell_size(precision)
+
+    cells = []
+    seen = set()
+    # One sample per cell width from edge to edge of the circle's bounding box
+    # (the antimeridian is not handled; coverage is clamped to valid degrees)
+    y = lat - dlat
+    while y <= lat + dlat + step_lat:
+        x = lon - dlon
+        while x <= lon + dlon + step_lon:
+            cell = encode(min(max(y, -90.0), 89.999999), min(max(x, -180.0), 179.999999), precision)
+            if cell not in seen:
+                seen.add(cell)
+                if _distance_to_cell_m(lat, lon, bbox(cell)) <= radius_m:
+                    cells.append(cell)
+            x += step_lon
+        y += step_lat
+    return cells
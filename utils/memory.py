@@ -1,4 +1,6 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from bson import ObjectId
 from datetime import datetime
 import uuid
 from utils.config import Config
@@ -6,51 +8,151 @@ from utils.utils import setup_logger
 
 logger = setup_logger(__name__)
 
+# Session fields a merge copies from a duplicate when the kept session lacks them
+MERGE_FILL_FIELDS = ("title", "filename", "details", "summary", "otc_result")
+
 class MemoryManager:
     def __init__(self):
         self.client = MongoClient(Config.MONGO_URI, **Config.get_tls_kwargs())
         self.db = self.client.get_database("prescription_db")
         self.sessions = self.db.sessions
         self.messages = self.db.messages
+        self.messages_archive = self.db.messages_archive
+        self._ensure_indexes()
         logger.info("Connected to MongoDB")
 
-    def get_or_create_session(self, user_id, prescription_id, title=None, filename=None, details=None):
-        existing_session = self.sessions.find_one({
+    def _ensure_indexes(self):
+        try:
+            self.sessions.create_index(
+                [("user_id", ASCENDING), ("prescription_id", ASCENDING)],
+                name="user_prescription_unique",
+                unique=True
+            )
+        except Exception as e:
+            logger.warning(f"Could not create unique session index (run scripts/merge_duplicate_sessions.py): {e}")
+        try:
+            # Newest-first keyset pagination over a session's messages
+            self.messages.create_index(
+                [("session_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+                name="session_timestamp"
+            )
+            # Covers the sidebar listing: filter, sort and projection from the index alone
+            self.sessions.create_index(
+                [("user_id", ASCENDING), ("last_active", DESCENDING),
+                 ("prescription_id", ASCENDING), ("title", ASCENDING)],
+                name="user_prescriptions"
+            )
+            self.sessions.create_index("session_id", name="session_id")
+        except Exception as e:
+            logger.warning(f"Could not ensure memory indexes: {e}")
+
+    def get_or_create_session(self, user_id, prescription_id, title=None, filename=None, details=None, medicines=None):
+        """
+        Atomic upsert of the (user_id, prescription_id) session. Optional
+        fields only fill in values that are still empty. Relies on the unique
+        index so concurrent callers converge on one session.
+        """
+        now = datetime.utcnow()
+        fill = {
+            "session_id": str(uuid.uuid4()),
+            "summary": "",
+            "created_at": now,
+            "last_active": now
+        }
+        stage = {k: {"$ifNull": [f"${k}", v]} for k, v in fill.items()}
+        for field, value in (("title", title), ("filename", filename), ("details", details), ("medicines", medicines)):
+            if value:
+                stage[field] = {"$cond": [
+                    {"$in": [{"$ifNull": [f"${field}", ""]}, ["", None]]},
+                    {"$literal": value},
+                    f"${field}"
+                ]}
+        query = {"user_id": user_id, "prescription_id": prescription_id}
+        for attempt in range(2):
+            try:
+                session = self.sessions.find_one_and_update(
+                    query,
+                    [{"$set": stage}],
+                    projection={"session_id": 1},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+                break
+            except DuplicateKeyError:
+                # Lost an upsert race; the winner's document now matches
+                if attempt:
+                    raise
+        if session["session_id"] == fill["session_id"]:
+            logger.info(f"Created new session {session['session_id']} for user {user_id} on prescription {prescription_id}")
+        return session["session_id"]
+
+    def get_session(self, user_id, prescription_id, cache=None):
+        """
+        Read-only session lookup. Pass a request-scoped dict as `cache` so the
+        same session is fetched at most once per request.
+        """
+        key = (user_id, prescription_id)
+        if cache is not None and key in cache:
+            return cache[key]
+        session = self.sessions.find_one({
             "user_id": user_id,
             "prescription_id": prescription_id
         })
-        if existing_session:
-            updates = {}
-            if title and not existing_session.get("title"):
-                updates["title"] = title
-            if filename and not existing_session.get("filename"):
-                updates["filename"] = filename
-            if details and not existing_session.get("details"):
-                updates["details"] = details
-            if updates:
-                self.sessions.update_one(
-                    {"_id": existing_session["_id"]},
-                    {"$set": updates}
-                )
-            return existing_session["session_id"]
-        session_id = str(uuid.uuid4())
-        doc = {
-            "session_id": session_id,
-            "user_id": user_id,
-            "prescription_id": prescription_id,
-            "summary": "",
-            "created_at": datetime.utcnow(),
-            "last_active": datetime.utcnow()
+        if cache is not None:
+            cache[key] = session
+        return session
+
+    def get_dashboard_view(self, user_id, active_id=None, message_limit=20, prescription_limit=20, cache=None):
+        """
+        Prescription list, active session and its latest messages in a single
+        aggregation round trip. Never writes.
+        """
+        facets = {
+            "prescriptions": self._prescription_page_stages(prescription_limit)
+        }
+        if active_id:
+            facets["active"] = [
+                {"$match": {"prescription_id": active_id}},
+                {"$limit": 1},
+                {"$lookup": {
+                    "from": self.messages.name,
+                    "localField": "session_id",
+                    "foreignField": "session_id",
+                    "pipeline": [
+                        {"$sort": {"timestamp": -1, "_id": -1}},
+                        {"$limit": message_limit + 1}
+                    ],
+                    "as": "recent_messages"
+                }}
+            ]
+        pipeline = [
+            {"$match": {"user_id": user_id, "prescription_id": {"$ne": "GLOBAL"}}},
+            {"$sort": {"last_active": -1}},
+            {"$facet": facets}
+        ]
+        result = next(self.sessions.aggregate(pipeline), {})
+
+        p_docs = result.get("prescriptions", [])
+        view = {
+            "prescriptions": self._format_prescriptions(p_docs[:prescription_limit]),
+            "prescriptions_cursor": self._prescription_cursor(p_docs, prescription_limit),
+            "active_session": None,
+            "messages": [],
+            "next_cursor": None
         }
-        if title:
-            doc["title"] = title
-        if filename:
-            doc["filename"] = filename
-        if details:
-            doc["details"] = details
-        self.sessions.insert_one(doc)
-        logger.info(f"Created new session {session_id} for user {user_id} on prescription {prescription_id}")
-        return session_id
+        active = result.get("active") or []
+        if active:
+            session = active[0]
+            docs = session.pop("recent_messages", [])
+            # Only sessions that actually have archived months pay for the extra read
+            page = self._finish_page(session["session_id"], docs, message_limit,
+                                     check_archive=bool(session.get("has_archive")))
+            view["active_session"] = session
+            view["messages"] = page["messages"]
+            view["next_cursor"] = page["next_cursor"]
+            if cache is not None:
+                cache[(user_id, active_id)] = session
+        return view
 
     def get_session_details(self, session_id):
         session = self.sessions.find_one({"session_id": session_id})
@@ -74,9 +176,83 @@ class MemoryManager:
         })
         self.update_last_active(session_id)
 
-    def get_history(self, session_id, limit=10):
-        cursor = self.messages.find({"session_id": session_id}).sort("timestamp", 1).limit(limit)
-        return list(cursor)
+    def get_history(self, session_id, limit=10, check_archive=None):
+        """Return the latest `limit` messages of a session in chronological order."""
+        return self.get_history_page(session_id, limit=limit, check_archive=check_archive)["messages"]
+
+    def get_history_page(self, session_id, limit=20, before=None, check_archive=None):
+        """
+        Keyset-paginated history, newest page first.
+        `before` is the `next_cursor` of a previous page; messages are returned
+        oldest-to-newest within the page so they can be prepended as-is.
+        Pass `check_archive` (the session's `has_archive`) when the session
+        document is already at hand; otherwise the marker is looked up only
+        if the hot messages run out.
+        """
+        query = {"session_id": session_id}
+        position = self._decode_cursor(before) if before else None
+        if position:
+            query.update(self._keyset_before(position))
+        cursor = self.messages.find(query).sort(
+            [("timestamp", DESCENDING), ("_id", DESCENDING)]
+        ).limit(limit + 1)
+        return self._finish_page(session_id, list(cursor), limit, position, check_archive)
+
+    def _finish_page(self, session_id, docs, limit, position=None, check_archive=None):
+        # Hot collection exhausted: continue seamlessly into the monthly archive,
+        # for the few sessions RetentionManager has actually archived
+        if len(docs) <= limit and (self._has_archive(session_id) if check_archive is None else check_archive):
+            anchor = (docs[-1]["timestamp"], docs[-1]["_id"]) if docs else position
+            docs = docs + self._get_archived_messages(session_id, limit + 1 - len(docs), anchor)
+        has_more = len(docs) > limit
+        docs = docs[:limit]
+        next_cursor = self._encode_cursor(docs[-1]) if has_more and docs else None
+        docs.reverse()
+        return {"messages": docs, "next_cursor": next_cursor}
+
+    def _has_archive(self, session_id):
+        return self.sessions.find_one(
+            {"session_id": session_id, "has_archive": True}, projection={"_id": 1}
+        ) is not None
+
+    def _get_archived_messages(self, session_id, limit, before=None):
+        match = {"session_id": session_id}
+        if before:
+            match["month"] = {"$lte": before[0].strftime("%Y-%m")}
+        pipeline = [
+            {"$match": match},
+            {"$sort": {"month": -1}},
+            {"$unwind": "$messages"},
+            {"$replaceRoot": {"newRoot": "$messages"}}
+        ]
+        if before:
+            pipeline.append({"$match": self._keyset_before(before)})
+        pipeline += [
+            {"$sort": {"timestamp": -1, "_id": -1}},
+            {"$limit": limit}
+        ]
+        return list(self.messages_archive.aggregate(pipeline))
+
+    @staticmethod
+    def _keyset_before(position):
+        ts, oid = position
+        return {"$or": [
+            {"timestamp": {"$lt": ts}},
+            {"timestamp": ts, "_id": {"$lt": oid}}
+        ]}
+
+    @staticmethod
+    def _encode_cursor(doc):
+        return f"{doc['timestamp'].isoformat()}_{doc['_id']}"
+
+    @staticmethod
+    def _decode_cursor(cursor):
+        try:
+            ts_str, oid_str = cursor.rsplit("_", 1)
+            return datetime.fromisoformat(ts_str), ObjectId(oid_str)
+        except Exception:
+            logger.warning(f"Invalid history cursor: {cursor}")
+            return None
 
     def get_summary(self, session_id):
         session = self.sessions.find_one({"session_id": session_id})
@@ -94,22 +270,151 @@ class MemoryManager:
             {"$set": {"last_active": datetime.utcnow()}}
         )
     
-    def get_user_prescriptions(self, user_id):
-        cursor = self.sessions.find(
-            {"user_id": user_id, "prescription_id": {"$ne": "GLOBAL"}},
-            {"prescription_id": 1, "title": 1, "last_active": 1}
-        ).sort("last_active", -1)
-        results = []
-        seen_ids = set()
-        for doc in cursor:
-            p_id = doc["prescription_id"]
-            if p_id not in seen_ids:
-                results.append({
-                    "id": p_id,
-                    "title": doc.get("title", f"Prescription {p_id[:8]}...")
-                })
-                seen_ids.add(p_id)
-        return results
+    def get_user_prescriptions(self, user_id, limit=20, after=None, with_count=False):
+        """
+        One page of a user's prescriptions, most recently active first.
+        Deduplication, ordering and paging all happen server-side; `after` is
+        the `next_cursor` of the previous page.
+        """
+        page_stages = self._prescription_page_stages(limit, after)
+        if with_count:
+            pipeline = [
+                {"$match": {"user_id": user_id, "prescription_id": {"$ne": "GLOBAL"}}},
+                {"$sort": {"last_active": -1}},
+                {"$facet": {
+                    "items": page_stages,
+                    "total": [
+                        {"$group": {"_id": "$prescription_id"}},
+                        {"$count": "n"}
+                    ]
+                }}
+            ]
+            result = next(self.sessions.aggregate(pipeline), {})
+            docs = result.get("items", [])
+            total = result["total"][0]["n"] if result.get("total") else 0
+        else:
+            pipeline = [
+                {"$match": {"user_id": user_id, "prescription_id": {"$ne": "GLOBAL"}}},
+                {"$sort": {"last_active": -1}}
+            ] + page_stages
+            docs = list(self.sessions.aggregate(pipeline))
+            total = None
+        page = {
+            "prescriptions": self._format_prescriptions(docs[:limit]),
+            "next_cursor": self._prescription_cursor(docs, limit)
+        }
+        if with_count:
+            page["total"] = total
+        return page
+
+    def _prescription_page_stages(self, limit, after=None):
+        stages = [
+            {"$group": {
+                "_id": "$prescription_id",
+                "title": {"$first": "$title"},
+                "last_active": {"$first": "$last_active"}
+            }}
+        ]
+        if after:
+            try:
+                ts_str, p_id = after.split("_", 1)
+                ts = datetime.fromisoformat(ts_str)
+                stages.append({"$match": {"$or": [
+                    {"last_active": {"$lt": ts}},
+                    {"last_active": ts, "_id": {"$gt": p_id}}
+                ]}})
+            except ValueError:
+                logger.warning(f"Invalid prescriptions cursor: {after}")
+        stages += [
+            {"$sort": {"last_active": -1, "_id": 1}},
+            {"$limit": limit + 1},
+            {"$project": {"_id": 0, "prescription_id": "$_id", "title": 1, "last_active": 1}}
+        ]
+        return stages
+
+    @staticmethod
+    def _prescription_cursor(docs, limit):
+        if len(docs) <= limit:
+            return None
+        last = docs[limit - 1]
+        if not last.get("last_active"):
+            return None
+        return f"{last['last_active'].isoformat()}_{last['prescription_id']}"
+
+    @staticmethod
+    def _format_prescriptions(docs):
+        return [
+            {
+                "id": doc["prescription_id"],
+                "title": doc.get("title") or f"Prescription {doc['prescription_id'][:8]}..."
+            }
+            for doc in docs
+        ]
+
+    def merge_duplicate_sessions(self, dry_run=False):
+        """
+        Collapse sessions sharing (user_id, prescription_id) into the oldest
+        one, re-pointing their messages. Returns the number of sessions removed.
+        """
+        groups = self.sessions.aggregate([
+            {"$sort": {"created_at": 1, "_id": 1}},
+            {"$group": {
+                "_id": {"user_id": "$user_id", "prescription_id": "$prescription_id"},
+                "docs": {"$push": {
+                    "_id": "$_id", "session_id": "$session_id",
+                    "created_at": "$created_at", "last_active": "$last_active"
+                }},
+                "count": {"$sum": 1}
+            }},
+            {"$match": {"count": {"$gt": 1}}}
+        ], allowDiskUse=True)
+        removed = 0
+        for group in groups:
+            keeper, *dupes = group["docs"]
+            # Only the duplicated sessions are read in full
+            full = {
+                doc["_id"]: doc
+                for doc in self.sessions.find({"_id": {"$in": [d["_id"] for d in group["docs"]]}},
+                                              projection=dict.fromkeys(MERGE_FILL_FIELDS, 1))
+            }
+            kept, others = full.get(keeper["_id"], {}), [full.get(d["_id"], {}) for d in dupes]
+            updates = {}
+            for field in MERGE_FILL_FIELDS:
+                if not kept.get(field):
+                    value = next((d[field] for d in others if d.get(field)), None)
+                    if value:
+                        updates[field] = value
+            # Legacy sessions may lack created_at; the ObjectId carries their creation time
+            created_at = keeper.get("created_at") or keeper["_id"].generation_time.replace(tzinfo=None)
+            last_active = max((d.get("last_active") or created_at) for d in group["docs"])
+            if last_active != keeper.get("last_active"):
+                updates["last_active"] = last_active
+            dupe_session_ids = [d["session_id"] for d in dupes if d.get("session_id")]
+            logger.info(f"Merging {len(dupes)} duplicate session(s) into {keeper['session_id']} for {group['_id']}")
+            if not dry_run:
+                self.messages.update_many(
+                    {"session_id": {"$in": dupe_session_ids}},
+                    {"$set": {"session_id": keeper["session_id"]}}
+                )
+                self._merge_archived_messages(keeper["session_id"], dupe_session_ids)
+                if updates:
+                    self.sessions.update_one({"_id": keeper["_id"]}, {"$set": updates})
+                self.sessions.delete_many({"_id": {"$in": [d["_id"] for d in dupes]}})
+            removed += len(dupes)
+        if not dry_run:
+            self._ensure_indexes()
+        return removed
+
+    def _merge_archived_messages(self, keeper_session_id, dupe_session_ids):
+        for doc in self.messages_archive.find({"session_id": {"$in": dupe_session_ids}}):
+            messages = [dict(m, session_id=keeper_session_id) for m in doc.get("messages", [])]
+            self.messages_archive.update_one(
+                {"session_id": keeper_session_id, "month": doc["month"]},
+                {"$addToSet": {"messages": {"$each": messages}}},
+                upsert=True
+            )
+            self.messages_archive.delete_one({"_id": doc["_id"]})
+            self.sessions.update_one({"session_id": keeper_session_id}, {"$set": {"has_archive": True}})
 
     def get_all_sessions(self):
         return list(self.sessions.find().sort("last_active", -1))
@@ -133,6 +438,7 @@ class MemoryManager:
             session_id = session.get("session_id")
             # Delete messages
             self.messages.delete_many({"session_id": session_id})
+            self.messages_archive.delete_many({"session_id": session_id})
             # Delete session
             self.sessions.delete_one({"_id": session["_id"]})
             logger.info(f"Deleted session {session_id} for user {user_id}")
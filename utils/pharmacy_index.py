@@ -0,0 +1,161 @@
+import glob
+import gzip
+import json
+import os
+import threading
+from math import radians, sin, cos, sqrt, atan2
+from typing import Dict, Iterable, List, Optional, Tuple
+from utils import geohash
+from utils.config import Config
+from utils.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+INDEX_VERSION = 1
+# ~4.9 km cells: a 5 km search touches about eight of them
+INDEX_PRECISION = 5
+# Row layout in the index file
+FIELDS = ["latitude", "longitude", "name", "address", "phone", "opening_hours"]
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    return 6371000 * 2 * atan2(sqrt(a), sqrt(1 - a))
+
+
+def write_index(path: str, pharmacies: Iterable[Dict], bounds: Tuple[float, float, float, float], source: str = "") -> int:
+    """
+    Write a gzipped JSON geohash-grid index: rows of FIELDS plus
+    {cell: [row numbers]} at INDEX_PRECISION, and the (south, west, north,
+    east) area the extract covers. Returns the number of pharmacies.
+    """
+    rows, cells = [], {}
+    for pharmacy in pharmacies:
+        cell = geohash.encode(pharmacy["latitude"], pharmacy["longitude"], INDEX_PRECISION)
+        cells.setdefault(cell, []).append(len(rows))
+        rows.append([pharmacy.get(field) for field in FIELDS])
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as fh:
+        json.dump({
+            "version": INDEX_VERSION,
+            "precision": INDEX_PRECISION,
+            "source": source,
+            "bounds": list(bounds),
+            "rows": rows,
+            "cells": cells
+        }, fh, separators=(",", ":"))
+    os.replace(tmp_path, path)
+    return len(rows)
+
+
+class _Region:
+    def __init__(self, data: Dict, path: str):
+        self.path = path
+        self.bounds = tuple(data["bounds"])
+        self.precision = data["precision"]
+        self.rows = data["rows"]
+        self.cells = data["cells"]
+
+    def contains(self, lat: float, lon: float, radius_m: float) -> bool:
+        """True when the whole search circle lies inside the extract's area"""
+        south, west, north, east = self.bounds
+        dlat = radius_m / geohash.METERS_PER_DEGREE_LAT
+        dlon = radius_m / (geohash.METERS_PER_DEGREE_LAT * max(cos(radians(lat)), 0.01))
+        return south <= lat - dlat and lat + dlat <= north and west <= lon - dlon and lon + dlon <= east
+
+    def within(self, lat: float, lon: float, radius_m: float) -> List[Dict]:
+        found = []
+        for cell in geohash.covering(lat, lon, radius_m, self.precision):
+            for i in self.cells.get(cell, ()):
+                row = self.rows[i]
+                dist = haversine_m(lat, lon, row[0], row[1])
+                if dist <= radius_m:
+                    found.append((dist, row))
+        found.sort(key=lambda item: item[0])
+        return [self._to_result(row, dist) for dist, row in found]
+
+    @staticmethod
+    def _to_result(row: List, dist: float) -> Dict:
+        pharmacy = dict(zip(FIELDS, row))
+        return {
+            "name": pharmacy["name"] or "Unknown Pharmacy",
+            "address": pharmacy["address"] or "Address details not available",
+            "phone": pharmacy["phone"] or "N/A",
+            "latitude": pharmacy["latitude"],
+            "longitude": pharmacy["longitude"],
+            "distance": dist,
+            "rating": "N/A",
+            "is_open_now": pharmacy["opening_hours"] or "N/A",
+            "source": "OpenStreetMap (offline)"
+        }
+
+
+class OfflinePharmacyIndex:
+    """
+    Local pharmacy lookups from index files built by
+    scripts/import_osm_pharmacies.py (one per region, in PHARMACY_INDEX_DIR).
+
+    A query is answered locally only when one region's extract covers the
+    whole search area; callers fall back to Overpass otherwise (None).
+    Files are loaded on first use.
+    """
+
+    def __init__(self, index_dir: str = Config.PHARMACY_INDEX_DIR):
+        self.index_dir = index_dir
+        self._regions: Optional[List[_Region]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def regions(self) -> List[_Region]:
+        if self._regions is None:
+            with self._lock:
+                if self._regions is None:
+                    self._regions = self._load()
+        return self._regions
+
+    def _load(self) -> List[_Region]:
+        regions = []
+        for path in sorted(glob.glob(os.path.join(self.index_dir, "*.json.gz"))):
+            try:
+                with gzip.open(path, "rt", encoding="utf-8") as fh:
+                    data = json.load(fh)
+                if data.get("version") != INDEX_VERSION:
+                    logger.warning(f"Skipping pharmacy index {path}: unsupported version {data.get('version')}")
+                    continue
+                regions.append(_Region(data, path))
+                logger.info(f"Loaded offline pharmacy index {path} ({len(data['rows'])} pharmacies)")
+            except Exception as e:
+                logger.error(f"Could not load pharmacy index {path}: {e}")
+        return regions
+
+    def _region_for(self, lat: float, lon: float, radius_m: float) -> Optional[_Region]:
+        for region in self.regions:
+            if region.contains(lat, lon, radius_m):
+                return region
+        return None
+
+    def within(self, lat: float, lon: float, radius_m: float, limit: Optional[int] = None) -> Optional[List[Dict]]:
+        """Pharmacies within radius_m, nearest first; None when the area is not covered"""
+        region = self._region_for(lat, lon, radius_m)
+        if region is None:
+            return None
+        results = region.within(lat, lon, radius_m)
+        return results[:limit] if limit else results
+
+    def nearest(self, lat: float, lon: float, k: int = 5, max_radius_m: float = 50000) -> Optional[List[Dict]]:
+        """
+        The k nearest pharmacies, searching outward in doubling radii.
+        None when the point is not covered.
+        """
+        radius = 1000.0
+        while True:
+            region = self._region_for(lat, lon, radius)
+            if region is None:
+                # Grew past the extract before finding k: a closer one may lie outside it
+                return None
+            results = region.within(lat, lon, radius)
+            if len(results) >= k or radius >= max_radius_m:
+                return results[:k]
+            radius = min(radius * 2, max_radius_m)
@@ -1,9 +1,79 @@
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional, Tuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import threading
+import time
 import requests
+from utils.config import Config
+from utils import geohash
+from utils.geocode_cache import GeocodeCache, NOT_FOUND
+from utils.pharmacy_index import OfflinePharmacyIndex
+from utils.pharmacy_tiles import PharmacyTileCache
 from utils.utils import setup_logger
 
 logger = setup_logger(__name__)
 
+# Longest a geocode waits for any provider (the slowest provider timeout)
+GEOCODE_DEADLINE_SECONDS = 8
+
+# Pharmacy tiles: ~4.9 km cells for searches up to 10 km, ~39 x 20 km beyond
+TILE_PRECISION_SMALL = 5
+TILE_PRECISION_LARGE = 4
+SMALL_RADIUS_METERS = 10000
+
+
+class ProviderHealth:
+    """
+    Moving averages of each geocoder's latency and success, used to order
+    providers so the fastest reliable one is tried first. Providers with no
+    history keep their default position.
+    """
+
+    def __init__(self, alpha: float = 0.2, failure_penalty: float = 1.0):
+        self.alpha = alpha
+        # Seconds charged for a failed attempt, so fast-failing providers sink too
+        self.failure_penalty = failure_penalty
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, name: str, outcome: str, seconds: float):
+        # A clean "no match" is a working provider; only errors count against it
+        ok = 0.0 if outcome == "error" else 1.0
+        with self._lock:
+            entry = self._stats.get(name)
+            if entry is None:
+                self._stats[name] = {"latency": seconds, "success": ok, "calls": 1}
+                return
+            entry["latency"] += self.alpha * (seconds - entry["latency"])
+            entry["success"] += self.alpha * (ok - entry["success"])
+            entry["calls"] += 1
+
+    def ranked(self, providers: List[Tuple[str, Callable]]) -> List[Tuple[str, Callable]]:
+        with self._lock:
+            stats = dict(self._stats)
+
+        def expected_cost(item):
+            index, (name, _) = item
+            entry = stats.get(name)
+            if entry is None:
+                return (0, index)
+            # Expected seconds to a usable answer; floor keeps dead providers orderable
+            cost = entry["latency"] + (1 - entry["success"]) * self.failure_penalty
+            return (cost / max(entry["success"], 0.05), index)
+
+        return [provider for _, provider in sorted(enumerate(providers), key=expected_cost)]
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                name: {
+                    "avg_latency_ms": round(entry["latency"] * 1000, 1),
+                    "success_rate": round(entry["success"] * 100, 1),
+                    "calls": entry["calls"]
+                }
+                for name, entry in self._stats.items()
+            }
+
+
 class PharmacyLocator:
     def __init__(self):
         # OpenStreetMap Headers (Required by their Usage Policy)
@@ -11,117 +81,153 @@ class PharmacyLocator:
         self.headers = {
             'User-Agent': 'PharmEZ-MedicalApp/1.0 (Student Project; vishalgangisetty@example.com)'
         }
+        self.geocode_cache = GeocodeCache()
+        self.tile_cache = PharmacyTileCache()
+        self.offline_index = OfflinePharmacyIndex()
+        self.hedge_delay = Config.GEOCODE_HEDGE_DELAY_MS / 1000
+        self.provider_health = ProviderHealth(failure_penalty=self.hedge_delay)
+        self._executor = ThreadPoolExecutor(max_workers=Config.GEOCODE_MAX_WORKERS, thread_name_prefix="geocode")
+        # Default order; each returns (lat, lon), None for no match, or raises
+        self.geocoders = [
+            ("nominatim", self._geocode_nominatim),
+            ("photon", self._geocode_photon),
+            ("open_meteo", self._geocode_open_meteo)
+        ]
     
+    def geocode_stats(self) -> Dict:
+        """This process's geocode cache hits/misses per provider, plus live provider health"""
+        return {
+            "cache": self.geocode_cache.stats(),
+            "providers": self.provider_health.snapshot()
+        }
+
     def geocode_address(self, address: str) -> Optional[tuple]:
         """
-        Geocode an address using multiple providers for reliability:
-        1. Nominatim (OSM)
-        2. Photon (Komoot)
-        3. OpenMeteo
+        Geocode an address using multiple providers for reliability
+        (Nominatim, Photon, OpenMeteo), hedged: the best-ranked provider
+        goes first, the next one starts after GEOCODE_HEDGE_DELAY_MS or as
+        soon as the previous one fails, and the first answer wins.
+        Answers, including confirmed misses, are cached by normalized address.
         """
-        # 1. Try Nominatim (Primary)
-        coords = self._geocode_nominatim(address)
-        if coords:
-            return coords
-            
-        # 2. Try Photon (Fallback 1)
-        logger.warning(f"Nominatim failed for '{address}', trying Photon fallback...")
-        coords = self._geocode_photon(address)
-        if coords:
-            return coords
+        cached = self.geocode_cache.get(address)
+        if cached == NOT_FOUND:
+            return None
+        if cached:
+            return cached
 
-        # 3. Try OpenMeteo (Fallback 2)
-        logger.warning(f"Photon failed, trying OpenMeteo fallback...")
-        coords = self._geocode_open_meteo(address)
-        return coords
+        queue = self.provider_health.ranked(self.geocoders)
+        pending = {}
+        outcomes = []
+        deadline = time.monotonic() + GEOCODE_DEADLINE_SECONDS
+        while queue or pending:
+            if queue:
+                name, lookup = queue.pop(0)
+                pending[self._executor.submit(self._timed_lookup, name, lookup, address)] = name
+            # Wait for an answer; hedge with the next provider if none arrives in time
+            timeout = self.hedge_delay if queue else max(deadline - time.monotonic(), 0)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                outcome, coords = future.result()
+                outcomes.append(outcome)
+                if coords:
+                    # Late finishers still record their stats; their answers are dropped
+                    for other in pending:
+                        other.cancel()
+                    self.geocode_cache.put(address, coords, name)
+                    return coords
+            if not queue and not done and time.monotonic() >= deadline:
+                break
 
-    def _geocode_nominatim(self, address: str) -> Optional[tuple]:
+        # Only a clean "no match" from every provider is worth remembering
+        if len(outcomes) == len(self.geocoders) and all(o == "no_match" for o in outcomes):
+            self.geocode_cache.put(address, None)
+        return None
+
+    def _timed_lookup(self, name: str, lookup, address: str) -> Tuple[str, Optional[tuple]]:
+        started = time.monotonic()
         try:
-            url = "https://nominatim.openstreetmap.org/search"
-            params = {
-                "q": address,
-                "format": "json",
-                "limit": 1
-            }
-            # Nominatim STRICTLY requires a unique User-Agent with contact info
-            headers = {
-                'User-Agent': 'PharmEZ-Student-App/1.0 (vishal.student@example.com)' 
-            }
-            response = requests.get(url, params=params, headers=headers, timeout=8)
-            
-            if response.status_code != 200:
-                logger.warning(f"Nominatim API Status: {response.status_code}")
-                return None
-                
-            data = response.json()
-            if data and isinstance(data, list) and len(data) > 0:
-                lat = float(data[0]['lat'])
-                lon = float(data[0]['lon'])
-                logger.info(f"Nominatim Geocoded '{address}': {lat}, {lon}")
-                return (lat, lon)
-            return None
+            coords = lookup(address)
+            outcome = "success" if coords else "no_match"
         except Exception as e:
-            logger.warning(f"Nominatim lookup error: {e}")
-            return None
+            logger.warning(f"{name} lookup error for '{address}': {e}")
+            coords, outcome = None, "error"
+        self.provider_health.record(name, outcome, time.monotonic() - started)
+        self.geocode_cache.record_call(name, outcome)
+        return outcome, coords
+
+    def _geocode_nominatim(self, address: str) -> Optional[tuple]:
+        url = "https://nominatim.openstreetmap.org/search"
+        params = {
+            "q": address,
+            "format": "json",
+            "limit": 1
+        }
+        # Nominatim STRICTLY requires a unique User-Agent with contact info
+        headers = {
+            'User-Agent': 'PharmEZ-Student-App/1.0 (vishal.student@example.com)' 
+        }
+        response = requests.get(url, params=params, headers=headers, timeout=8)
+        
+        if response.status_code != 200:
+            raise RuntimeError(f"Nominatim API Status: {response.status_code}")
+            
+        data = response.json()
+        if data and isinstance(data, list) and len(data) > 0:
+            lat = float(data[0]['lat'])
+            lon = float(data[0]['lon'])
+            logger.info(f"Nominatim Geocoded '{address}': {lat}, {lon}")
+            return (lat, lon)
+        return None
 
     def _geocode_photon(self, address: str) -> Optional[tuple]:
-        try:
-            url = "https://photon.komoot.io/api/"
-            params = {
-                "q": address,
-                "limit": 1
-            }
-            # Photon sometimes blocks custom UAs, so use a standard one or the one they recommend
-            # But let's try a standard compatible one to avoid 403
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (compatible; PharmEZ/1.0)'
-            }
-            response = requests.get(url, params=params, headers=headers, timeout=5)
+        url = "https://photon.komoot.io/api/"
+        params = {
+            "q": address,
+            "limit": 1
+        }
+        # Photon sometimes blocks custom UAs, so use a standard one or the one they recommend
+        # But let's try a standard compatible one to avoid 403
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (compatible; PharmEZ/1.0)'
+        }
+        response = requests.get(url, params=params, headers=headers, timeout=5)
+        
+        if response.status_code != 200:
+            raise RuntimeError(f"Photon API Status: {response.status_code}")
             
-            if response.status_code != 200:
-                logger.warning(f"Photon API Status: {response.status_code}")
-                return None
-                
-            data = response.json()
-            if data and data.get('features'):
-                coords = data['features'][0]['geometry']['coordinates']
-                lon = float(coords[0])
-                lat = float(coords[1])
-                logger.info(f"Photon Geocoded '{address}': {lat}, {lon}")
-                return (lat, lon)
-            return None
-        except Exception as e:
-            logger.warning(f"Photon lookup error: {e}")
-            return None
+        data = response.json()
+        if data and data.get('features'):
+            coords = data['features'][0]['geometry']['coordinates']
+            lon = float(coords[0])
+            lat = float(coords[1])
+            logger.info(f"Photon Geocoded '{address}': {lat}, {lon}")
+            return (lat, lon)
+        return None
 
     def _geocode_open_meteo(self, address: str) -> Optional[tuple]:
-        try:
-            url = "https://geocoding-api.open-meteo.com/v1/search"
-            params = {
-                "name": address,
-                "count": 1,
-                "language": "en",
-                "format": "json"
-            }
-            # OpenMeteo is very reliable
-            headers = {'User-Agent': 'Mozilla/5.0 (compatible; PharmEZ/1.0)'}
-            response = requests.get(url, params=params, headers=headers, timeout=5)
-            
-            if response.status_code != 200:
-                 logger.warning(f"OpenMeteo API Status: {response.status_code}")
-                 return None
-            
-            data = response.json()
-            if data and 'results' in data and len(data['results']) > 0:
-                res = data['results'][0]
-                lat = float(res['latitude'])
-                lon = float(res['longitude'])
-                logger.info(f"OpenMeteo Geocoded '{address}': {lat}, {lon}")
-                return (lat, lon)
-            return None
-        except Exception as e:
-            logger.error(f"OpenMeteo lookup error: {e}")
-            return None
+        url = "https://geocoding-api.open-meteo.com/v1/search"
+        params = {
+            "name": address,
+            "count": 1,
+            "language": "en",
+            "format": "json"
+        }
+        # OpenMeteo is very reliable
+        headers = {'User-Agent': 'Mozilla/5.0 (compatible; PharmEZ/1.0)'}
+        response = requests.get(url, params=params, headers=headers, timeout=5)
+        
+        if response.status_code != 200:
+            raise RuntimeError(f"OpenMeteo API Status: {response.status_code}")
+        
+        data = response.json()
+        if data and 'results' in data and len(data['results']) > 0:
+            res = data['results'][0]
+            lat = float(res['latitude'])
+            lon = float(res['longitude'])
+            logger.info(f"OpenMeteo Geocoded '{address}': {lat}, {lon}")
+            return (lat, lon)
+        return None
     
     def find_nearby_pharmacies(
         self,
@@ -131,90 +237,133 @@ class PharmacyLocator:
         max_results: int = 15
     ) -> List[Dict]:
         """
-        Find pharmacies using Overpass API (OpenStreetMap)
+        Find pharmacies using the offline OSM index when it covers the search
+        area, otherwise the Overpass API (OpenStreetMap). Overpass results are
+        cached per geohash tile; only uncached tiles of the circle are fetched.
         """
         try:
-            # Overpass QL query: Find nodes/ways with amenity=pharmacy within radius around lat,lon
-            overpass_url = "https://overpass-api.de/api/interpreter"
-            search_radius = radius  # meters
-            
-            # Query for pharmacies
-            # [out:json];(node["amenity"="pharmacy"](around:radius,lat,lon);way["amenity"="pharmacy"](around:radius,lat,lon);relation["amenity"="pharmacy"](around:radius,lat,lon););out center;
-            
-            query = f"""
-                [out:json];
-                (
-                  node["amenity"="pharmacy"](around:{search_radius},{latitude},{longitude});
-                  way["amenity"="pharmacy"](around:{search_radius},{latitude},{longitude});
-                  relation["amenity"="pharmacy"](around:{search_radius},{latitude},{longitude});
-                );
-                out center {max_results};
-            """
-            
-            response = requests.post(overpass_url, data=query, timeout=25)
-            
-            if response.status_code != 200:
-                logger.error(f"Overpass API Error: Status {response.status_code} - {response.text}")
-                return self._get_sample_pharmacies_with_distance(latitude, longitude, radius)
+            # Regions with an imported OSM extract are answered locally
+            local = self.offline_index.within(latitude, longitude, radius, max_results)
+            if local:
+                return local
+            # Covered but empty: the extract may be stale, so ask Overpass, but
+            # never answer a covered area with sample data
+            covered = local is not None
+            if covered:
+                logger.info(f"No pharmacies within {radius} m in offline index; trying Overpass.")
 
-            try:
-                data = response.json()
-            except ValueError:
-                logger.error(f"Overpass Response Error: Expected JSON but got: {response.text[:200]}")
-                return self._get_sample_pharmacies_with_distance(latitude, longitude, radius)
+            precision = TILE_PRECISION_SMALL if radius <= SMALL_RADIUS_METERS else TILE_PRECISION_LARGE
+            cells = geohash.covering(latitude, longitude, radius, precision)
+            tiles = self.tile_cache.get_many(cells)
+            missing = [cell for cell in cells if cell not in tiles]
+            if missing:
+                try:
+                    fetched = self._fetch_tiles(missing)
+                    self.tile_cache.put_many(fetched)
+                    tiles.update(fetched)
+                except Exception as e:
+                    logger.error(f"Overpass fetch failed for {len(missing)} tiles: {e}")
+                    if not tiles:
+                        return [] if covered else self._get_sample_pharmacies_with_distance(latitude, longitude, radius)
+            logger.info(f"Pharmacy search: {len(cells) - len(missing)}/{len(cells)} tiles from cache")
             
             pharmacies = []
-            for element in data.get('elements', []):
-                # Handle different element types (node vs way/relation have center)
-                lat = element.get('lat') or element.get('center', {}).get('lat')
-                lon = element.get('lon') or element.get('center', {}).get('lon')
-                
-                if not lat or not lon:
-                    continue
-                    
-                tags = element.get('tags', {})
-                name = tags.get('name', 'Unknown Pharmacy')
-                
-                # Format Address from available tags
-                addr_parts = [
-                    tags.get('addr:housenumber'),
-                    tags.get('addr:street'),
-                    tags.get('addr:city'),
-                    tags.get('addr:postcode')
-                ]
-                address = ", ".join(filter(None, addr_parts))
-                if not address:
-                    address = "Address details not available"
-                
-                # Calculate distance
-                dist = self.calculate_distance(latitude, longitude, lat, lon) * 1000 # to meters
-
-                pharmacies.append({
-                    "name": name,
-                    "address": address,
-                    "phone": tags.get('phone', tags.get('contact:phone', 'N/A')),
-                    "latitude": lat,
-                    "longitude": lon,
-                    "distance": dist,
-                    "rating": "N/A", # OSM doesn't have ratings
-                    "is_open_now": tags.get('opening_hours', 'N/A'),
-                    "source": "OpenStreetMap"
-                })
+            for cell_pharmacies in tiles.values():
+                for pharmacy in cell_pharmacies:
+                    # Calculate distance
+                    dist = self.calculate_distance(latitude, longitude, pharmacy['latitude'], pharmacy['longitude']) * 1000 # to meters
+                    if dist <= radius:
+                        pharmacies.append({**pharmacy, "distance": dist})
             
             # Sort by distance
             pharmacies.sort(key=lambda x: x['distance'])
             
             # Fallback to sample data if empty (OSM might be sparse in some areas)
             if not pharmacies:
+                if covered:
+                    logger.info("No pharmacies in offline index or Overpass for a covered area.")
+                    return []
                 logger.info("No OSM results found, returning sample data.")
                 return self._get_sample_pharmacies_with_distance(latitude, longitude, radius)
 
-            return pharmacies
+            return pharmacies[:max_results]
             
         except Exception as e:
             logger.error(f"OSM Search Error: {e}")
             return self._get_sample_pharmacies_with_distance(latitude, longitude, radius)
 
+    def find_nearest_pharmacies(self, latitude: float, longitude: float, k: int = 5) -> List[Dict]:
+        """The k nearest pharmacies: offline index when covered, else a 5 km Overpass search"""
+        local = self.offline_index.nearest(latitude, longitude, k)
+        if local:
+            return local
+        return self.find_nearby_pharmacies(latitude, longitude, 5000, k)
+
+    def _fetch_tiles(self, cells: List[str]) -> Dict[str, List[Dict]]:
+        """One Overpass query for the given geohash cells; returns every cell, empty or not"""
+        overpass_url = "https://overpass-api.de/api/interpreter"
+        clauses = []
+        for cell in cells:
+            south, west, north, east = geohash.bbox(cell)
+            box = f"({south},{west},{north},{east})"
+            clauses.append(
+                f'node["amenity"="pharmacy"]{box};way["amenity"="pharmacy"]{box};relation["amenity"="pharmacy"]{box};'
+            )
+        query = f"[out:json][timeout:25];({''.join(clauses)});out center;"
+        
+        response = requests.post(overpass_url, data=query, timeout=25)
+        if response.status_code != 200:
+            raise RuntimeError(f"Overpass API Error: Status {response.status_code} - {response.text[:200]}")
+        try:
+            data = response.json()
+        except ValueError:
+            raise RuntimeError(f"Overpass Response Error: Expected JSON but got: {response.text[:200]}")
+        
+        precision = len(cells[0])
+        tiles = {cell: [] for cell in cells}
+        for element in data.get('elements', []):
+            pharmacy = self._parse_osm_element(element)
+            if not pharmacy:
+                continue
+            # A way can intersect a box while its center lies in a neighbour; file it by its point
+            cell = geohash.encode(pharmacy['latitude'], pharmacy['longitude'], precision)
+            if cell in tiles:
+                tiles[cell].append(pharmacy)
+        return tiles
+
+    def _parse_osm_element(self, element: Dict) -> Optional[Dict]:
+        # Handle different element types (node vs way/relation have center)
+        lat = element.get('lat') or element.get('center', {}).get('lat')
+        lon = element.get('lon') or element.get('center', {}).get('lon')
+        
+        if not lat or not lon:
+            return None
+            
+        tags = element.get('tags', {})
+        name = tags.get('name', 'Unknown Pharmacy')
+        
+        # Format Address from available tags
+        addr_parts = [
+            tags.get('addr:housenumber'),
+            tags.get('addr:street'),
+            tags.get('addr:city'),
+            tags.get('addr:postcode')
+        ]
+        address = ", ".join(filter(None, addr_parts))
+        if not address:
+            address = "Address details not available"
+        
+        return {
+            "name": name,
+            "address": address,
+            "phone": tags.get('phone', tags.get('contact:phone', 'N/A')),
+            "latitude": lat,
+            "longitude": lon,
+            "rating": "N/A", # OSM doesn't have ratings
+            "is_open_now": tags.get('opening_hours', 'N/A'),
+            "source": "OpenStreetMap"
+        }
+
     def calculate_distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
         """Calculate distance in km"""
         from math import radians, sin, cos, sqrt, atan2
@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List
+from pymongo import MongoClient, UpdateOne
+from utils.config import Config
+from utils.utils import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class PharmacyTileCache:
+    """
+    Overpass pharmacy results cached per geohash cell in
+    medimate.pharmacy_tiles. A tile holds every pharmacy whose point falls in
+    that cell (an empty list means "fetched, none there") and expires after
+    PHARMACY_TILE_TTL_HOURS via a TTL index.
+    """
+
+    def __init__(self, ttl_hours: int = Config.PHARMACY_TILE_TTL_HOURS):
+        self.ttl = timedelta(hours=ttl_hours)
+        self.tiles = None
+        try:
+            self.client = MongoClient(Config.MONGO_URI, **Config.get_tls_kwargs())
+            self.tiles = self.client['medimate']['pharmacy_tiles']
+            self.tiles.create_index("expires_at", name="expires_at_ttl", expireAfterSeconds=0)
+        except Exception as e:
+            logger.warning(f"Pharmacy tile cache disabled: {e}")
+
+    def get_many(self, cells: Iterable[str]) -> Dict[str, List[Dict]]:
+        """{cell: pharmacies} for the cells that are cached and fresh"""
+        if self.tiles is None:
+            return {}
+        try:
+            docs = self.tiles.find(
+                {"_id": {"$in": list(cells)}, "expires_at": {"$gt": datetime.utcnow()}},
+                {"pharmacies": 1}
+            )
+            return {doc["_id"]: doc.get("pharmacies", []) for doc in docs}
+        except Exception as e:
+            logger.warning(f"Pharmacy tile read failed: {e}")
+            return {}
+
+    def put_many(self, tiles: Dict[str, List[Dict]]):
+        if self.tiles is None or not tiles:
+            return
+        now = datetime.utcnow()
+        try:
+            self.tiles.bulk_write([
+                UpdateOne(
+                    {"_id": cell},
+                    {"$set": {"pharmacies": pharmacies, "fetched_at": now, "expires_at": now + self.ttl}},
+                    upsert=True
+                )
+                for cell, pharmacies in tiles.items()
+            ], ordered=False)
+        except Exception as e:
+            logger.warning(f"Pharmacy tile write failed: {e}")
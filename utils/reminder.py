@@ -1,18 +1,170 @@
-from datetime import datetime, timedelta
+import re
+from datetime import datetime, date, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from typing import List, Dict, Optional
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from utils.config import Config
 from utils.utils import setup_logger
 
 logger = setup_logger(__name__)
 
+UTC = ZoneInfo("UTC")
+
+# Two days past valid_to: longer than any catch-up replay (MAX_TICK_MINUTES)
+FIRE_SLOT_RETENTION_SECONDS = 2 * 24 * 3600
+
+DURATION_UNITS = {"day": 1, "week": 7, "month": 30}
+
+
+def slot_for_time(time_str: str) -> str:
+    """Default morning/afternoon/night bucket for an HH:MM time"""
+    if time_str < "12:00":
+        return "morning"
+    if time_str < "17:00":
+        return "afternoon"
+    return "night"
+
+
+def build_slot_map(times: List[str], explicit: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """
+    {slot: "HH:MM"} for a reminder. Times covered by `explicit` keep its
+    slot name; the rest are bucketed by clock time, numbering repeats
+    (morning, morning_2, ...).
+    """
+    explicit = explicit or {}
+    by_time = {t: slot for slot, t in explicit.items()}
+    slots = {}
+    for time_str in sorted(set(times)):
+        base = by_time.get(time_str) or slot_for_time(time_str)
+        name, n = base, 1
+        while name in slots:
+            n += 1
+            name = f"{base}_{n}"
+        slots[name] = time_str
+    return slots
+
+
+def reminder_slots(reminder: Dict) -> Dict[str, str]:
+    """{slot: "HH:MM"} stored on a reminder, derived from its times for legacy documents"""
+    return reminder.get('slots') or build_slot_map(reminder.get('times', []))
+
+
+# A count (or "1-2" / "2 to 3" range) directly followed by a unit: "2 weeks", "1-2 wks"
+DURATION_PATTERN = re.compile(
+    r"(\d+)(?:\s*(?:-|–|to|or)\s*(\d+))?\s*(day|d|week|wk|w|month|mo)s?\b"
+)
+UNIT_ALIASES = {"d": "day", "w": "week", "wk": "week", "mo": "month"}
+
+
+def parse_duration_days(text, default: int) -> int:
+    """
+    '5 days', '2 weeks', '1-2 weeks' (upper bound), '1 month', '10' -> days.
+    A number inside other text needs a unit: '10 tablets' or 'take 2 daily'
+    carry no duration -> default.
+    """
+    if isinstance(text, (int, float)) and not isinstance(text, bool):
+        return int(text) if text > 0 else default
+    text = str(text or '').strip().lower()
+    if text.isdigit():
+        # The extractor's duration field is in days
+        return int(text) or default
+    match = DURATION_PATTERN.search(text)
+    if not match:
+        return default
+    count = max(int(match.group(1)), int(match.group(2) or 0))
+    unit = UNIT_ALIASES.get(match.group(3), match.group(3))
+    days = count * DURATION_UNITS[unit]
+    return days if days > 0 else default
+
+
+def resolve_timezone(name: Optional[str]) -> ZoneInfo:
+    """IANA zone for a reminder, falling back to Config.DEFAULT_TIMEZONE"""
+    try:
+        return ZoneInfo(name or Config.DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning(f"Unknown timezone '{name}', using {Config.DEFAULT_TIMEZONE}")
+        return ZoneInfo(Config.DEFAULT_TIMEZONE)
+
 
 class ReminderManager:
-    def __init__(self):
+    def __init__(self, db_name: str = 'medimate'):
         self.client = MongoClient(Config.MONGO_URI, **Config.get_tls_kwargs())
-        self.db = self.client['medimate']
+        self.db = self.client[db_name]
         self.reminders = self.db['reminders']
         self.adherence = self.db['adherence_log']
+        self.adherence_archive = self.db['adherence_archive']
+        self.daily_rollups = self.db['adherence_daily']
+        self.notification_log = self.db['notification_log']
+        self.fire_slots = self.db['reminder_fire_slots']
+        self._ensure_indexes()
+        self._ensure_rollups()
+        self._ensure_fire_slots()
+
+    def _ensure_indexes(self):
+        try:
+            # Covers both the daily taken-slot lookup and the stats $group
+            self.adherence.create_index(
+                [("user_id", ASCENDING), ("date", ASCENDING), ("status", ASCENDING),
+                 ("medicine_name", ASCENDING), ("scheduled_time", ASCENDING)],
+                name="user_date_status_medicine"
+            )
+            # One reminder per (prescription, medicine, times) when created from a plan
+            self.reminders.create_index(
+                [("user_id", ASCENDING), ("plan_key", ASCENDING)],
+                name="user_plan_key",
+                unique=True,
+                partialFilterExpression={"plan_key": {"$exists": True}}
+            )
+            self.daily_rollups.create_index(
+                [("user_id", ASCENDING), ("date", ASCENDING), ("medicine_name", ASCENDING)],
+                name="user_date_medicine",
+                unique=True
+            )
+            # Due-set lookup: equality on minute, then only slots not yet expired
+            self.fire_slots.create_index(
+                [("minute", ASCENDING), ("valid_to", ASCENDING), ("valid_from", ASCENDING)],
+                name="minute_valid_to"
+            )
+            if "minute_validity" in self.fire_slots.index_information():
+                self.fire_slots.drop_index("minute_validity")
+            # Expired slots are pruned once even a full catch-up replay is past them
+            self.fire_slots.create_index(
+                "valid_to", name="valid_to_ttl", expireAfterSeconds=FIRE_SLOT_RETENTION_SECONDS
+            )
+            self.fire_slots.create_index("reminder_id", name="reminder_id")
+            self.notification_log.create_index(
+                [("reminder_id", ASCENDING), ("fire_at", ASCENDING)],
+                name="reminder_fire_unique",
+                unique=True
+            )
+            self.notification_log.create_index("sent_at", name="sent_at_ttl", expireAfterSeconds=30 * 24 * 3600)
+        except Exception as e:
+            logger.warning(f"Could not ensure reminder indexes: {e}")
+
+    def _ensure_fire_slots(self):
+        # The engine reads only fire slots: build them on the first start
+        # against a deployment whose reminders predate them
+        try:
+            if self.fire_slots.estimated_document_count() == 0 and self.reminders.find_one(
+                {"is_active": True, "email_notification": True}, projection={"_id": 1}
+            ):
+                logger.info("Reminder fire slots are empty; building them from reminders")
+                self.rebuild_fire_slots()
+        except Exception as e:
+            logger.error(f"Could not build reminder fire slots (run scripts/rebuild_fire_slots.py): {e}")
+
+    def _ensure_rollups(self):
+        # get_adherence_stats reads only the rollups: build them on the first
+        # start against a deployment that already has adherence history
+        try:
+            if self.daily_rollups.estimated_document_count() == 0 and (
+                self.adherence.estimated_document_count() or self.adherence_archive.estimated_document_count()
+            ):
+                logger.info("Daily adherence rollups are empty; backfilling from adherence_log")
+                self.backfill_daily_rollups()
+        except Exception as e:
+            logger.error(f"Could not backfill daily adherence rollups (run scripts/backfill_adherence_rollups.py): {e}")
     
     def add_reminder(
         self,
@@ -26,27 +178,19 @@ class ReminderManager:
         instructions: Optional[str] = None,
         with_food: bool = False,
         email_notification: bool = False,
-        notification_email: Optional[str] = None
+        notification_email: Optional[str] = None,
+        timezone: Optional[str] = None,
+        slots: Optional[Dict[str, str]] = None
     ) -> Dict:
         try:
-            reminder = {
-                "user_id": user_id,
-                "medicine_name": medicine_name,
-                "dosage": dosage,
-                "frequency": frequency,
-                "times": times,
-                "duration_days": duration_days,
-                "start_date": start_date,
-                "end_date": self._calculate_end_date(start_date, duration_days),
-                "instructions": instructions,
-                "with_food": with_food,
-                "email_notification": email_notification,
-                "notification_email": notification_email,
-                "is_active": True,
-                "created_at": datetime.now().isoformat()
-            }
+            reminder = self._reminder_doc(
+                user_id, medicine_name, dosage, frequency, times, duration_days, start_date,
+                instructions=instructions, with_food=with_food, email_notification=email_notification,
+                notification_email=notification_email, timezone=timezone, slots=slots
+            )
             
             result = self.reminders.insert_one(reminder)
+            self.sync_fire_slots(reminder)
             reminder['_id'] = str(result.inserted_id)
             
             logger.info(f"Reminder added for {medicine_name} by user {user_id}")
@@ -56,6 +200,153 @@ class ReminderManager:
             logger.error(f"Error adding reminder: {str(e)}")
             return {"success": False, "error": str(e)}
     
+    def add_reminders_bulk(
+        self,
+        user_id: str,
+        items: List[Dict],
+        start_date: str,
+        email_notification: bool = False,
+        notification_email: Optional[str] = None,
+        timezone: Optional[str] = None,
+        prescription_id: Optional[str] = None
+    ) -> Dict:
+        """
+        Insert several reminders (and their fire slots) with one insert_many
+        each. `items` use the medication form keys: name, dosage, frequency,
+        times, duration, instructions.
+
+        With a `prescription_id`, a (prescription, medicine, times) reminder
+        that already exists is skipped, so re-submitting a plan is harmless.
+        """
+        try:
+            docs = []
+            for item in items:
+                doc = self._reminder_doc(
+                    user_id, item['name'], item.get('dosage', ''), item.get('frequency', 'Daily'),
+                    item['times'], item['duration'], start_date,
+                    instructions=item.get('instructions'), email_notification=email_notification,
+                    notification_email=notification_email, timezone=timezone, slots=item.get('slots')
+                )
+                if prescription_id:
+                    doc['prescription_id'] = prescription_id
+                    doc['plan_key'] = f"{prescription_id}|{doc['medicine_name']}|{','.join(sorted(doc['times']))}"
+                docs.append(doc)
+            if prescription_id and docs:
+                existing = {
+                    r['plan_key'] for r in self.reminders.find(
+                        {"user_id": user_id, "plan_key": {"$in": [d['plan_key'] for d in docs]}},
+                        projection={"plan_key": 1}
+                    )
+                }
+                docs = [d for d in docs if d['plan_key'] not in existing]
+            duplicates = len(items) - len(docs)
+            if not docs:
+                return {"success": True, "created": 0, "duplicates": duplicates, "ids": []}
+            
+            try:
+                self.reminders.insert_many(docs, ordered=False)
+            except BulkWriteError as e:
+                # A concurrent submit of the same plan won the unique plan_key
+                failed = {err['index'] for err in e.details.get('writeErrors', []) if err.get('code') == 11000}
+                if len(failed) != len(e.details.get('writeErrors', [])):
+                    raise
+                docs = [d for i, d in enumerate(docs) if i not in failed]
+                duplicates += len(failed)
+            slots = [slot for doc in docs for slot in self._build_fire_slots(doc)]
+            if slots:
+                self.fire_slots.insert_many(slots, ordered=False)
+            
+            logger.info(f"{len(docs)} reminders added in bulk for user {user_id} ({duplicates} already existed)")
+            return {"success": True, "created": len(docs), "duplicates": duplicates, "ids": [str(doc['_id']) for doc in docs]}
+        
+        except Exception as e:
+            logger.error(f"Error adding reminders in bulk: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def _reminder_doc(
+        self,
+        user_id: str,
+        medicine_name: str,
+        dosage: str,
+        frequency: str,
+        times: List[str],
+        duration_days: int,
+        start_date: str,
+        instructions: Optional[str] = None,
+        with_food: bool = False,
+        email_notification: bool = False,
+        notification_email: Optional[str] = None,
+        timezone: Optional[str] = None,
+        slots: Optional[Dict[str, str]] = None
+    ) -> Dict:
+        return {
+            "user_id": user_id,
+            "medicine_name": medicine_name,
+            "dosage": dosage,
+            "frequency": frequency,
+            "times": times,
+            "slots": build_slot_map(times, slots),
+            "duration_days": duration_days,
+            "start_date": start_date,
+            "end_date": self._calculate_end_date(start_date, duration_days),
+            "instructions": instructions,
+            "with_food": with_food,
+            "email_notification": email_notification,
+            "notification_email": notification_email,
+            "timezone": resolve_timezone(timezone).key,
+            "is_active": True,
+            "created_at": datetime.now().isoformat(),
+            "updated_at": datetime.utcnow()
+        }
+
+    def plan_from_prescription(
+        self,
+        medicines: List[Dict],
+        slot_times: Optional[Dict[str, str]] = None,
+        default_days: int = Config.DEFAULT_REMINDER_DAYS
+    ) -> Dict[str, List]:
+        """
+        Turn extracted medicines into medication-form items. Each non-zero
+        morning/afternoon/night count maps to its default clock time.
+        """
+        slot_times = slot_times or Config.REMINDER_SLOT_TIMES
+        items, skipped = [], []
+        for med in medicines:
+            name = (med.get('name') or '').strip()
+            timing = med.get('timing') or {}
+            slots = {
+                slot: slot_times[slot] for slot in ("morning", "afternoon", "night")
+                if slot in slot_times and self._dose_count(timing.get(slot)) > 0
+            }
+            times = sorted(set(slots.values()))
+            if not name or not times:
+                skipped.append(name or '(unnamed)')
+                continue
+            instructions = timing.get('food_timing') or timing.get('instruction') or ''
+            dosage = med.get('dosage') or med.get('quantity') or ''
+            items.append({
+                "name": name,
+                "dosage": '' if dosage in ('-', 'None') else dosage,
+                "frequency": "Daily",
+                "times": times,
+                "slots": slots,
+                "duration": parse_duration_days(med.get('duration'), default_days),
+                "instructions": None if instructions in ('', '-') else instructions
+            })
+        return {"items": items, "skipped": skipped}
+
+    @staticmethod
+    def _dose_count(value) -> float:
+        """'1', '1/2', '0.5', 1 -> number of units; '-', '', None -> 0"""
+        text = str(value or '').strip()
+        try:
+            if '/' in text:
+                num, den = text.split('/', 1)
+                return float(num) / float(den)
+            return float(text)
+        except (ValueError, ZeroDivisionError):
+            return 0
+
     def get_user_reminders(self, user_id: str, active_only: bool = True) -> List[Dict]:
         try:
             query = {"user_id": user_id}
@@ -80,8 +371,10 @@ class ReminderManager:
                 "start_date": {"$lte": today},
                 "end_date": {"$gte": today}
             }))
+            taken_slots = self._get_taken_slots(user_id, today) if reminders else set()
             todays_schedule = []
             for reminder in reminders:
+                slot_by_time = {t: slot for slot, t in reminder_slots(reminder).items()}
                 for time in reminder['times']:
                     todays_schedule.append({
                         "_id": str(reminder['_id']),
@@ -89,11 +382,12 @@ class ReminderManager:
                         "medicine_name": reminder['medicine_name'],
                         "dosage": reminder['dosage'],
                         "time": time,
+                        "time_slot": slot_by_time.get(time) or slot_for_time(time),
                         "times": reminder['times'],
                         "frequency": reminder['frequency'],
                         "with_food": reminder.get('with_food', False),
                         "instructions": reminder.get('instructions', ''),
-                        "taken": self._check_if_taken(user_id, reminder['medicine_name'], today, time)
+                        "taken": (reminder['medicine_name'], time) in taken_slots
                     })
             todays_schedule.sort(key=lambda x: x['time'])
             return todays_schedule
@@ -103,96 +397,38 @@ class ReminderManager:
             return []
 
     def get_logs_for_date(self, user_id: str, date_obj) -> List[Dict]:
-        """Get adherence logs for a specific date"""
+        """Get adherence logs for a specific date; each log carries its time_slot"""
         try:
             date_str = date_obj.isoformat() if hasattr(date_obj, 'isoformat') else str(date_obj)
-            
-            logs = list(self.adherence.find({
+            return list(self.adherence.find({
                 "user_id": user_id,
                 "date": date_str
             }))
             
-            # Add time_slot based on scheduled_time logic if not present
-            # The UI expects 'time_slot' but our mark_as_taken only saves 'scheduled_time'
-            # We need to map scheduled_time back to morning/afternoon/night or ensure UI is robust
-            # For now, let's just return the logs and let's see how UI uses it.
-            # Looking at UI: it checks log['time_slot'] == 'morning' etc.
-            # But the log entry in mark_as_taken doesn't seem to save 'time_slot'.
-            # We need to fix mark_as_taken to save time_slot or infer it here.
-            
-            # Let's infer it here if possible, or just pass it as is.
-            # Actually, looking at mark_as_taken, it takes 'scheduled_time'.
-            # The UI logic: log['time_slot'] == 'morning'
-            # We need to check if 'time_slot' is in the log.
-            # If not, we might fail.
-            # Let's assume we need to add 'time_slot' to the log when retrieving or when saving.
-            # Since we can't easily change existing logs, let's try to infer or match by time.
-            
-            # Wait, the UI code says:
-            # log_entry = next((log for log in today_logs if log['medicine_name'] == med_name and log['time_slot'] == 'morning'), None)
-            
-            # But mark_as_taken saves:
-            # "scheduled_time": scheduled_time
-            
-            # So indeed, 'time_slot' is missing from the log.
-            # I must fix this mismatch.
-            # For now, I will add a hack in get_logs_for_date to try to find the time slot from the reminder settings? 
-            # OR better, I should modify the UI to match by time, OR modify get_logs_for_date to map times.
-            
-            # Let's get the reminders to map times to slots
-            reminders = self.get_user_reminders(user_id)
-            for log in logs:
-                if 'time_slot' not in log:
-                    # Try to find the reminder and map the time
-                    med_name = log.get('medicine_name')
-                    time = log.get('scheduled_time')
-                    
-                    found = False
-                    for r in reminders:
-                        if r.get('medicine_name') == med_name:
-                            # Check r['times'] (which is a list of strings)
-                            # But we need to know if it's morning/afternoon/night
-                            # The 'reminders' from get_user_reminders stores 'times' as a list.
-                            # It DOES NOT store which slot it belongs to explicitly like {'morning': '08:00'}.
-                            # Wait, in add_reminder, we saw:
-                            # "times": times (list)
-                            # But the UI sends:
-                            # schedule['morning']...
-                            
-                            # Let's look at add_reminder again in UI:
-                            # schedule = {} -> schedule['morning'] = ...
-                            # But then it calls add_reminder with times=times_list (sorted list)
-                            # So the backend 'reminder' object ONLY has a list of times. It lost the key 'morning'/'afternoon'.
-                            
-                            # However, the UI `render_active_schedule` tries to use `reminder.get('schedule', {})`.
-                            # `get_user_reminders` returns the raw mongo document.
-                            # It does NOT seem to have a 'schedule' field with 'morning'/'afternoon' keys if we look at `add_reminder` implementation in reminder.py:
-                            # It saves: "times": times, "frequency": frequency... but NOT the "morning"/"afternoon" map.
-                            
-                            # So `reminder.get('schedule', {})` in UI will be EMPTY!
-                            # The UI code is trying to read non-existent data structure 'schedule'.
-                            pass
-            
-            # This reveals a deeper data structure mismatch.
-            # The backend stores "times": ["08:00", "20:00"]
-            # The UI `render_active_schedule` expects `reminder.get('schedule')` to be `{'morning': '08:00', ...}`
-            
-            # I need to adapt `get_logs_for_date` AND likely `render_active_schedule`.
-            # But let's start by implementing `get_logs_for_date` simply returning the logs.
-            # And then I will probably have to fix `src/ui_pages_medical.py` to handle the 'times' list instead of 'schedule' dict.
-            
-            return logs
-            
         except Exception as e:
             logger.error(f"Error fetching logs: {str(e)}")
             return []
     
+    def resolve_time_slot(self, user_id: str, medicine_name: str, scheduled_time: str) -> str:
+        """Slot of the user's reminder dose at scheduled_time (clock-time bucket if none schedules it)"""
+        reminder = self.reminders.find_one(
+            {"user_id": user_id, "medicine_name": medicine_name, "is_active": True, "times": scheduled_time},
+            projection={"times": 1, "slots": 1}
+        )
+        if reminder:
+            slots = reminder_slots(reminder)
+            for slot, time_str in slots.items():
+                if time_str == scheduled_time:
+                    return slot
+        return slot_for_time(scheduled_time)
+
     def mark_as_taken(
         self,
         user_id: str,
         medicine_name: str,
         scheduled_time: str,
-        actual_time: Optional[str] = None
+        actual_time: Optional[str] = None,
+        time_slot: Optional[str] = None
     ) -> Dict:
         """Mark a reminder as taken"""
         try:
@@ -203,13 +439,14 @@ class ReminderManager:
                 "user_id": user_id,
                 "medicine_name": medicine_name,
                 "scheduled_time": scheduled_time,
+                "time_slot": time_slot or slot_for_time(scheduled_time),
                 "actual_time": actual_time,
                 "date": datetime.now().date().isoformat(),
                 "timestamp": datetime.now().isoformat(),
                 "status": "taken"
             }
             
-            self.adherence.insert_one(log_entry)
+            self._record_dose(log_entry)
             logger.info(f"Marked {medicine_name} as taken for user {user_id}")
             
             return {"success": True, "message": "Marked as taken"}
@@ -223,7 +460,8 @@ class ReminderManager:
         user_id: str,
         medicine_name: str,
         scheduled_time: str,
-        reason: Optional[str] = None
+        reason: Optional[str] = None,
+        time_slot: Optional[str] = None
     ) -> Dict:
         """Mark a reminder as skipped"""
         try:
@@ -231,13 +469,14 @@ class ReminderManager:
                 "user_id": user_id,
                 "medicine_name": medicine_name,
                 "scheduled_time": scheduled_time,
+                "time_slot": time_slot or slot_for_time(scheduled_time),
                 "date": datetime.now().date().isoformat(),
                 "timestamp": datetime.now().isoformat(),
                 "status": "skipped",
                 "reason": reason
             }
             
-            self.adherence.insert_one(log_entry)
+            self._record_dose(log_entry)
             logger.info(f"Marked {medicine_name} as skipped for user {user_id}")
             
             return {"success": True, "message": "Marked as skipped"}
@@ -250,31 +489,29 @@ class ReminderManager:
         """Get adherence statistics for the last N days"""
         try:
             # Get active reminders
-            reminders = list(self.reminders.find({
-                "user_id": user_id,
-                "is_active": True
-            }))
+            reminders = list(self.reminders.find(
+                {"user_id": user_id, "is_active": True},
+                {"medicine_name": 1, "dosage": 1, "times": 1}
+            ))
             
             start_date = (datetime.now() - timedelta(days=days)).date().isoformat()
             
-            logs = list(self.adherence.find({
-                "user_id": user_id,
-                "date": {"$gte": start_date}
-            }))
+            # {medicine_name: {status: count}}, summed from the daily rollups
+            counts = self._count_doses_by_medicine(user_id, start_date)
             
-            total = len(logs)
-            taken = len([log for log in logs if log['status'] == 'taken'])
-            missed = len([log for log in logs if log['status'] == 'skipped'])
+            total = sum(sum(by_status.values()) for by_status in counts.values())
+            taken = sum(by_status.get('taken', 0) for by_status in counts.values())
+            missed = sum(by_status.get('skipped', 0) for by_status in counts.values())
             
             adherence_rate = (taken / total * 100) if total > 0 else 0
             
             # Build detailed stats per reminder
             reminder_details = []
             for reminder in reminders:
-                med_logs = [log for log in logs if log.get('medicine_name') == reminder['medicine_name']]
-                med_total = len(med_logs)
-                med_taken = len([log for log in med_logs if log['status'] == 'taken'])
-                med_missed = len([log for log in med_logs if log['status'] == 'skipped'])
+                by_status = counts.get(reminder['medicine_name'], {})
+                med_total = sum(by_status.values())
+                med_taken = by_status.get('taken', 0)
+                med_missed = by_status.get('skipped', 0)
                 med_adherence = (med_taken / med_total * 100) if med_total > 0 else 0
                 
                 reminder_details.append({
@@ -314,6 +551,7 @@ class ReminderManager:
         try:
             from bson.objectid import ObjectId
             result = self.reminders.delete_one({"_id": ObjectId(reminder_id)})
+            self.fire_slots.delete_many({"reminder_id": reminder_id})
             
             if result.deleted_count > 0:
                 return {"success": True, "message": "Reminder deleted"}
@@ -328,12 +566,14 @@ class ReminderManager:
         """Activate or deactivate a reminder"""
         try:
             from bson.objectid import ObjectId
-            result = self.reminders.update_one(
+            reminder = self.reminders.find_one_and_update(
                 {"_id": ObjectId(reminder_id)},
-                {"$set": {"is_active": is_active}}
+                {"$set": {"is_active": is_active, "updated_at": datetime.utcnow()}},
+                return_document=ReturnDocument.AFTER
             )
             
-            if result.modified_count > 0:
+            if reminder:
+                self.sync_fire_slots(reminder)
                 status = "activated" if is_active else "deactivated"
                 return {"success": True, "message": f"Reminder {status}"}
             else:
@@ -349,39 +589,322 @@ class ReminderManager:
         end = start + timedelta(days=duration_days)
         return end.date().isoformat()
     
-    def _check_if_taken(self, user_id: str, medicine_name: str, date: str, time: str) -> bool:
-        """Check if a medicine was marked as taken"""
-        log = self.adherence.find_one({
-            "user_id": user_id,
-            "medicine_name": medicine_name,
-            "date": date,
-            "scheduled_time": time,
-            "status": "taken"
-        })
-        return log is not None
+    def _count_doses_by_medicine(self, user_id: str, start_date: str) -> Dict[str, Dict[str, int]]:
+        """Dose counts per medicine and status since start_date, read from the daily rollups"""
+        rows = self.daily_rollups.aggregate([
+            {"$match": {"user_id": user_id, "date": {"$gte": start_date}}},
+            {"$group": {
+                "_id": "$medicine_name",
+                "taken": {"$sum": "$taken"},
+                "skipped": {"$sum": "$skipped"},
+                "total": {"$sum": "$total"}
+            }}
+        ])
+        counts: Dict[str, Dict[str, int]] = {}
+        for row in rows:
+            # Any status other than taken/skipped only contributes to the total
+            other = row['total'] - row['taken'] - row['skipped']
+            counts[row['_id']] = {'taken': row['taken'], 'skipped': row['skipped'], 'other': other}
+        return counts
+
+    def get_daily_adherence(self, user_id: str, days: int = 30) -> List[Dict]:
+        """Per-day taken/skipped/total counts for trend charts, oldest first"""
+        try:
+            start_date = (datetime.now() - timedelta(days=days)).date().isoformat()
+            rows = self.daily_rollups.aggregate([
+                {"$match": {"user_id": user_id, "date": {"$gte": start_date}}},
+                {"$group": {
+                    "_id": "$date",
+                    "taken": {"$sum": "$taken"},
+                    "skipped": {"$sum": "$skipped"},
+                    "total": {"$sum": "$total"}
+                }},
+                {"$sort": {"_id": 1}}
+            ])
+            return [
+                {"date": row['_id'], "taken": row['taken'], "skipped": row['skipped'], "total": row['total']}
+                for row in rows
+            ]
+        except Exception as e:
+            logger.error(f"Error fetching daily adherence: {str(e)}")
+            return []
 
-    def check_due_reminders(self) -> List[Dict]:
+    def iter_adherence_logs(
+        self,
+        user_id: str,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        medicine_name: Optional[str] = None,
+        batch_size: int = 500
+    ):
+        """
+        Yield a user's adherence logs (archived months first, then hot rows)
+        oldest first, straight off Mongo cursors so memory stays flat however
+        long the history is. Dates are inclusive YYYY-MM-DD strings.
+        """
+        log_filter = {"user_id": user_id}
+        if start_date or end_date:
+            log_filter["date"] = {}
+            if start_date:
+                log_filter["date"]["$gte"] = start_date
+            if end_date:
+                log_filter["date"]["$lte"] = end_date
+        if medicine_name:
+            log_filter["medicine_name"] = medicine_name
+
+        month_filter = {"user_id": user_id}
+        if start_date or end_date:
+            month_filter["month"] = {}
+            if start_date:
+                month_filter["month"]["$gte"] = start_date[:7]
+            if end_date:
+                month_filter["month"]["$lte"] = end_date[:7]
+        # Sorting on the (user_id, month) index avoids a blocking sort; rows
+        # within a month keep their archived order
+        archived = self.adherence_archive.aggregate([
+            {"$match": month_filter},
+            {"$sort": {"month": ASCENDING}},
+            {"$unwind": "$logs"},
+            {"$replaceRoot": {"newRoot": "$logs"}},
+            {"$match": log_filter},
+            {"$project": {"_id": 0}}
+        ], batchSize=batch_size)
+        for log in archived:
+            yield log
+
+        # (user_id, date) is a prefix of the adherence index, so this streams
+        hot = self.adherence.find(log_filter, {"_id": 0}).sort("date", ASCENDING).batch_size(batch_size)
+        for log in hot:
+            yield log
+
+    def _record_dose(self, log_entry: Dict):
         """
-        Check for reminders that are due within the next few minutes 
-        and haven't been notified yet (or simply return due ones for now).
-        This is intended for background scheduling.
+        Insert an adherence log and count it in the daily rollup. If the rollup
+        write fails the log is removed again, so the two never drift apart.
         """
+        result = self.adherence.insert_one(log_entry)
         try:
-            now = datetime.now()
-            current_time = now.strftime("%H:%M")
-            today = now.date().isoformat()
-            
-            # Find active reminders valid for today
-            active_reminders = list(self.reminders.find({
-                "is_active": True,
-                "email_notification": True,
-                "start_date": {"$lte": today},
-                "end_date": {"$gte": today},
-                "times": current_time
-            }))
-            
-            return active_reminders
-            
+            self._bump_daily_rollup(log_entry['user_id'], log_entry['medicine_name'], log_entry['date'], log_entry['status'])
+        except Exception:
+            self.adherence.delete_one({"_id": result.inserted_id})
+            raise
+
+    def _bump_daily_rollup(self, user_id: str, medicine_name: str, date: str, status: str):
+        self.daily_rollups.update_one(
+            {"user_id": user_id, "medicine_name": medicine_name, "date": date},
+            {"$inc": {
+                "taken": 1 if status == "taken" else 0,
+                "skipped": 1 if status == "skipped" else 0,
+                "total": 1
+            }},
+            upsert=True
+        )
+
+    def backfill_time_slots(self) -> Dict[str, int]:
+        """
+        One-off: give legacy reminders a slot map and legacy adherence logs a
+        time_slot. Logs take the slot from their reminder's map where one
+        matches, otherwise the clock-time bucket.
+        """
+        reminders_updated = 0
+        for reminder in self.reminders.find({"slots": {"$exists": False}}, {"times": 1}):
+            self.reminders.update_one(
+                {"_id": reminder['_id']},
+                {"$set": {"slots": build_slot_map(reminder.get('times', []))}}
+            )
+            reminders_updated += 1
+
+        logs_updated = 0
+        for reminder in self.reminders.find({}, {"user_id": 1, "medicine_name": 1, "slots": 1}):
+            for slot, time_str in (reminder.get('slots') or {}).items():
+                logs_updated += self.adherence.update_many(
+                    {
+                        "user_id": reminder['user_id'],
+                        "medicine_name": reminder['medicine_name'],
+                        "scheduled_time": time_str,
+                        "time_slot": {"$exists": False}
+                    },
+                    {"$set": {"time_slot": slot}}
+                ).modified_count
+        # Logs whose reminder is gone: bucket by clock time, server-side
+        logs_updated += self.adherence.update_many(
+            {"time_slot": {"$exists": False}},
+            [{"$set": {"time_slot": {"$switch": {
+                "branches": [
+                    {"case": {"$lt": ["$scheduled_time", "12:00"]}, "then": "morning"},
+                    {"case": {"$lt": ["$scheduled_time", "17:00"]}, "then": "afternoon"}
+                ],
+                "default": "night"
+            }}}}]
+        ).modified_count
+
+        logger.info(f"Backfilled slot maps on {reminders_updated} reminders and time_slot on {logs_updated} logs")
+        return {"reminders": reminders_updated, "logs": logs_updated}
+
+    def backfill_daily_rollups(self) -> int:
+        """
+        Rebuild the daily rollups from adherence_log and archived months.
+        Safe to re-run: each (user, medicine, day) document is replaced.
+        """
+        group = {
+            "taken": {"$sum": {"$cond": [{"$eq": ["$status", "taken"]}, 1, 0]}},
+            "skipped": {"$sum": {"$cond": [{"$eq": ["$status", "skipped"]}, 1, 0]}},
+            "total": {"$sum": 1}
+        }
+        tail = [
+            {"$group": dict(_id={"user_id": "$user_id", "medicine_name": "$medicine_name", "date": "$date"}, **group)},
+            {"$project": {
+                "_id": 0,
+                "user_id": "$_id.user_id",
+                "medicine_name": "$_id.medicine_name",
+                "date": "$_id.date",
+                "taken": 1, "skipped": 1, "total": 1
+            }},
+            {"$merge": {
+                "into": self.daily_rollups.name,
+                "on": ["user_id", "medicine_name", "date"],
+                "whenMatched": "replace",
+                "whenNotMatched": "insert"
+            }}
+        ]
+        # Archived days never overlap hot ones, so archive first, then hot
+        self.adherence_archive.aggregate([
+            {"$unwind": "$logs"},
+            {"$replaceRoot": {"newRoot": "$logs"}}
+        ] + tail, allowDiskUse=True)
+        self.adherence.aggregate(tail, allowDiskUse=True)
+        count = self.daily_rollups.count_documents({})
+        logger.info(f"Backfilled daily adherence rollups: {count} documents")
+        return count
+
+    def _get_taken_slots(self, user_id: str, date: str) -> set:
+        """(medicine_name, scheduled_time) pairs marked as taken on a date, in one query"""
+        logs = self.adherence.find(
+            {"user_id": user_id, "date": date, "status": "taken"},
+            {"_id": 0, "medicine_name": 1, "scheduled_time": 1}
+        )
+        return {(log.get('medicine_name'), log.get('scheduled_time')) for log in logs}
+
+    def check_due_reminders(self, now: Optional[datetime] = None) -> List[Dict]:
+        """Fire slots due at the current UTC minute (see get_due_slots)"""
+        try:
+            now = (now or datetime.utcnow()).replace(second=0, microsecond=0)
+            return self.get_due_slots([now])
         except Exception as e:
             logger.error(f"Error checking due reminders: {str(e)}")
             return []
+
+    def get_due_slots(self, instants: List[datetime]) -> List[Dict]:
+        """
+        Fire slots due at any of the given naive-UTC minute instants, in one query.
+        Each clause is an index probe on (minute, valid_to); every returned
+        slot carries the `fire_at` instant it matched.
+        """
+        if not instants:
+            return []
+        clauses = [
+            {"minute": t.hour * 60 + t.minute, "valid_from": {"$lte": t}, "valid_to": {"$gt": t}}
+            for t in instants
+        ]
+        by_minute = {t.hour * 60 + t.minute: [] for t in instants}
+        for t in instants:
+            by_minute[t.hour * 60 + t.minute].append(t)
+        due = []
+        for slot in self.fire_slots.find({"$or": clauses}):
+            for t in by_minute.get(slot['minute'], []):
+                if slot['valid_from'] <= t < slot['valid_to']:
+                    due.append(dict(slot, fire_at=t))
+        return due
+
+    def sync_fire_slots(self, reminder: Dict):
+        """Replace a reminder's fire slots; call whenever the reminder changes"""
+        reminder_id = str(reminder['_id'])
+        self.fire_slots.delete_many({"reminder_id": reminder_id})
+        slots = self._build_fire_slots(reminder)
+        if slots:
+            self.fire_slots.insert_many(slots, ordered=False)
+
+    def rebuild_fire_slots(self, batch_size: int = 1000) -> int:
+        """Regenerate every fire slot from the reminders collection"""
+        self.fire_slots.delete_many({})
+        # Earliest local "today" anywhere on the globe
+        today = (datetime.utcnow() - timedelta(hours=12)).date().isoformat()
+        cursor = self.reminders.find({"is_active": True, "email_notification": True, "end_date": {"$gte": today}})
+        batch, total = [], 0
+        for reminder in cursor:
+            batch.extend(self._build_fire_slots(reminder))
+            if len(batch) >= batch_size:
+                self.fire_slots.insert_many(batch, ordered=False)
+                total += len(batch)
+                batch = []
+        if batch:
+            self.fire_slots.insert_many(batch, ordered=False)
+            total += len(batch)
+        logger.info(f"Rebuilt {total} reminder fire slots")
+        return total
+
+    def _build_fire_slots(self, reminder: Dict) -> List[Dict]:
+        """
+        One slot per (reminder, UTC minute-of-day, UTC offset), with delivery
+        fields denormalized. The local dose time is converted to UTC day by
+        day in the reminder's timezone, so a DST transition starts a new slot
+        with its own UTC minute and validity window. Windows are naive UTC.
+        """
+        if not reminder.get('is_active') or not reminder.get('email_notification'):
+            return []
+        try:
+            start = date.fromisoformat(reminder['start_date'])
+            end = date.fromisoformat(reminder['end_date'])
+        except (KeyError, TypeError, ValueError):
+            return []
+        tz = resolve_timezone(reminder.get('timezone'))
+        slots = []
+        for time_str in set(reminder.get('times', [])):
+            try:
+                local_time = datetime.strptime(time_str, "%H:%M").time()
+            except (TypeError, ValueError):
+                continue
+            current = None
+            day = start
+            while day <= end:
+                local = datetime.combine(day, local_time, tzinfo=tz)
+                utc_offset = int(local.utcoffset().total_seconds() // 60)
+                fire_at = local.astimezone(UTC).replace(tzinfo=None)
+                minute = fire_at.hour * 60 + fire_at.minute
+                if current and current['minute'] == minute and current['utc_offset'] == utc_offset:
+                    current['valid_to'] = fire_at + timedelta(minutes=1)
+                else:
+                    current = {
+                        "reminder_id": str(reminder['_id']),
+                        "minute": minute,
+                        "utc_offset": utc_offset,
+                        "local_time": time_str,
+                        "timezone": tz.key,
+                        "valid_from": fire_at,
+                        "valid_to": fire_at + timedelta(minutes=1),
+                        "user_id": reminder.get('user_id'),
+                        "medicine_name": reminder.get('medicine_name'),
+                        "dosage": reminder.get('dosage'),
+                        "instructions": reminder.get('instructions'),
+                        "notification_email": reminder.get('notification_email')
+                    }
+                    slots.append(current)
+                day += timedelta(days=1)
+        return slots
+
+    def claim_notification(self, reminder_id: str, fire_at: datetime, recipient: Optional[str] = None) -> bool:
+        """Record a dose notification; False if this (reminder, fire time) was already sent"""
+        try:
+            self.notification_log.insert_one({
+                "reminder_id": reminder_id,
+                "fire_at": fire_at,
+                "recipient": recipient,
+                "sent_at": datetime.utcnow()
+            })
+            return True
+        except DuplicateKeyError:
+            return False
+
+    def release_notification(self, reminder_id: str, fire_at: datetime):
+        """Drop a claim whose delivery failed, so the dose can be claimed again"""
+        self.notification_log.delete_one({"reminder_id": reminder_id, "fire_at": fire_at})
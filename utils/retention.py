@@ -0,0 +1,178 @@
+import gzip
+import json
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from pymongo import MongoClient, ASCENDING, UpdateOne
+from utils.config import Config
+from utils.utils import setup_logger, ensure_directory
+
+logger = setup_logger(__name__)
+
+
+class RetentionManager:
+    """
+    Moves chat messages and adherence logs that fall outside the hot window
+    out of the working collections.
+
+    - "archive" mode compacts them into per-session (messages) and per-user
+      (adherence) monthly documents, which MemoryManager and ReminderManager
+      read transparently when a query reaches past the hot window. Sessions
+      with archived messages are flagged `has_archive`.
+    - "export" mode writes them to gzipped JSONL files under ARCHIVE_DIR and
+      removes them from Mongo entirely.
+    """
+
+    def __init__(self, hot_days: Optional[int] = None):
+        self.client = MongoClient(Config.MONGO_URI, **Config.get_tls_kwargs())
+        chat_db = self.client.get_database("prescription_db")
+        self.sessions = chat_db.sessions
+        self.messages = chat_db.messages
+        self.messages_archive = chat_db.messages_archive
+        med_db = self.client['medimate']
+        self.adherence = med_db['adherence_log']
+        self.adherence_archive = med_db['adherence_archive']
+        self.hot_days = hot_days if hot_days is not None else Config.RETENTION_HOT_DAYS
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        try:
+            self.messages_archive.create_index(
+                [("session_id", ASCENDING), ("month", ASCENDING)], unique=True, name="session_month"
+            )
+            self.adherence_archive.create_index(
+                [("user_id", ASCENDING), ("month", ASCENDING)], unique=True, name="user_month"
+            )
+            # Each retention batch is a range scan on these, oldest first
+            self.messages.create_index("timestamp", name="timestamp")
+            self.adherence.create_index("date", name="date")
+        except Exception as e:
+            logger.warning(f"Could not ensure archive indexes: {e}")
+
+    def cutoff(self) -> datetime:
+        return datetime.utcnow() - timedelta(days=self.hot_days)
+
+    def run(self, mode: str = "archive", export_dir: Optional[str] = None, batch_size: int = 1000) -> Dict:
+        if mode == "archive":
+            result = {
+                "messages": self.archive_messages(batch_size),
+                "adherence_logs": self.archive_adherence(batch_size)
+            }
+        elif mode == "export":
+            export_dir = export_dir or Config.ARCHIVE_DIR
+            result = {
+                "messages": self.export_messages(export_dir, batch_size),
+                "adherence_logs": self.export_adherence(export_dir, batch_size)
+            }
+        else:
+            raise ValueError(f"Unknown retention mode: {mode}")
+        logger.info(f"Retention ({mode}, hot window {self.hot_days}d): {result}")
+        return result
+
+    # --- Archive documents ---
+
+    def archive_messages(self, batch_size: int = 1000) -> int:
+        query = {"timestamp": {"$lt": self.cutoff()}}
+        return self._compact(
+            self.messages, self.messages_archive, query, "session_id", "messages",
+            month_of=lambda doc: doc["timestamp"].strftime("%Y-%m"),
+            batch_size=batch_size,
+            # Flag the sessions this batch archived, so history reads know to look
+            on_batch=self._mark_sessions
+        )
+
+    def mark_archived_sessions(self, batch_size: int = 1000) -> int:
+        """
+        Set `has_archive` on every session with archived months. The nightly
+        run flags sessions as it archives them; this full pass is only for
+        archives written before the marker existed (run_retention --mark-sessions).
+        """
+        marked = 0
+        session_ids = []
+        for doc in self.messages_archive.aggregate([{"$group": {"_id": "$session_id"}}], allowDiskUse=True):
+            session_ids.append(doc["_id"])
+            if len(session_ids) >= batch_size:
+                marked += self._mark_sessions(session_ids)
+                session_ids = []
+        if session_ids:
+            marked += self._mark_sessions(session_ids)
+        return marked
+
+    def _mark_sessions(self, session_ids) -> int:
+        result = self.sessions.update_many(
+            {"session_id": {"$in": session_ids}, "has_archive": {"$ne": True}},
+            {"$set": {"has_archive": True}}
+        )
+        return result.modified_count
+
+    def archive_adherence(self, batch_size: int = 1000) -> int:
+        query = {"date": {"$lt": self.cutoff().date().isoformat()}}
+        return self._compact(
+            self.adherence, self.adherence_archive, query, "user_id", "logs",
+            month_of=lambda doc: doc["date"][:7],
+            batch_size=batch_size
+        )
+
+    def _compact(self, source, archive, query, owner_field, array_field, month_of, batch_size, on_batch=None) -> int:
+        moved = 0
+        # Queries are a single indexed range ({field: {"$lt": cutoff}}); walk it in index order
+        field = next(iter(query))
+        while True:
+            batch = list(source.find(query).sort(field, ASCENDING).limit(batch_size))
+            if not batch:
+                return moved
+            buckets = defaultdict(list)
+            for doc in batch:
+                buckets[(doc.get(owner_field), month_of(doc))].append(doc)
+            # $addToSet keeps a re-run after a partial failure idempotent
+            archive.bulk_write([
+                UpdateOne(
+                    {owner_field: owner, "month": month},
+                    {"$addToSet": {array_field: {"$each": docs}},
+                     "$set": {"archived_at": datetime.utcnow()}},
+                    upsert=True
+                )
+                for (owner, month), docs in buckets.items()
+            ], ordered=False)
+            if on_batch:
+                on_batch(list({owner for owner, _ in buckets}))
+            source.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+            moved += len(batch)
+
+    # --- Compressed JSONL export ---
+
+    def export_messages(self, export_dir: str, batch_size: int = 1000) -> int:
+        query = {"timestamp": {"$lt": self.cutoff()}}
+        return self._export(
+            self.messages, query, os.path.join(export_dir, "messages"),
+            month_of=lambda doc: doc["timestamp"].strftime("%Y-%m"),
+            batch_size=batch_size
+        )
+
+    def export_adherence(self, export_dir: str, batch_size: int = 1000) -> int:
+        query = {"date": {"$lt": self.cutoff().date().isoformat()}}
+        return self._export(
+            self.adherence, query, os.path.join(export_dir, "adherence_log"),
+            month_of=lambda doc: doc["date"][:7],
+            batch_size=batch_size
+        )
+
+    def _export(self, source, query, target_dir, month_of, batch_size) -> int:
+        ensure_directory(target_dir)
+        moved = 0
+        field = next(iter(query))
+        while True:
+            batch = list(source.find(query).sort(field, ASCENDING).limit(batch_size))
+            if not batch:
+                return moved
+            by_month = defaultdict(list)
+            for doc in batch:
+                by_month[month_of(doc)].append(doc)
+            for month, docs in by_month.items():
+                # Appending gzip members yields a valid multi-member .gz file
+                with gzip.open(os.path.join(target_dir, f"{month}.jsonl.gz"), "at", encoding="utf-8") as fh:
+                    for doc in docs:
+                        fh.write(json.dumps(doc, default=str) + "\n")
+            source.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+            moved += len(batch)